@@ -13,15 +13,22 @@ Classes:
     UserEdit
     Board
 """
+import queue
 import tkinter as tk
 from PIL import ImageTk, Image
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import threading
 import tkinter.messagebox
 import tkinter.ttk
-import requests
+import config
 import cv
 import db
+import device
+import metrics
+import store
+import sync
 import theme
 
 
@@ -35,27 +42,52 @@ class Check(object):
         root: Ventana padre.
         window: Ventana actual.
         canvas: Lienzo para mostrar la lectura de la cámara.
-        recognize: Objeto que detecta rostros en imágenes.
+        recognizer: Algoritmo de reconocimiento compartido por las puertas.
+        updater: Hilo que aplica al modelo los rostros agregados o
+        eliminados.
+        doors: Puertas atendidas, cada una con su cámara y sensor.
+        door: Puerta que se muestra en pantalla y en la que se capturan
+        rostros.
+        lent: ¿La puerta en pantalla prestó su cámara para capturar rostros?
+        Las demás puertas siguen reconociendo.
+        writer: Hilo que escribe los eventos en la base de datos.
         label: Etiqueta que muestra información al usuario.
         label_timer: Temporizador para la etiqueta.
         label_job: Llamada a una función pasado un tiempo para la etiqueta.
         canvas_job: Llamada a una función pasado un tiempo para el lienzo.
         clock_job: Llamada a una función pasado un segundo para el reloj.
         icon: Set de íconos.
+        _painted: Número del último resultado dibujado en el lienzo.
+        _instance: Ventana de control de acceso abierta.
 
+    Methods:
+        instance
+        update_model
+        lend
+        update_canvas
+        update_label
+        _decide
     """
 
     root = None
     window = None
     canvas = None
-    recognize = None
+    recognizer = None
+    updater = None
+    doors = []
+    door = None
+    lent = False
+    writer = None
     label = None
     label_timer = 15
     label_job = None
     canvas_job = None
     clock_job = None
+    _painted = 0
+    _instance = None
 
     def __init__(self, parent):
+        Check._instance = self
         self.root = parent
         self.window = tk.Toplevel(parent)  # Crear ventana hija
         self.window.title('Control de acceso')
@@ -76,6 +108,14 @@ class Check(object):
         self._clock = tk.Label(self.window, font=('Arial', 28))
         self._clock.pack(fill=tk.X)
         self._update_clock()
+        db.DB.load_users()  # Saludar sin consultar la base de datos
+        self.writer = db.Writer()
+        self.writer.start()
+        monitor = metrics.Metrics.instance()
+        monitor.gauge('writer.backlog', self.writer.backlog)
+        monitor.start(config.METRICS_LOG, config.METRICS_INTERVAL,
+                      config.METRICS_PORT, config.METRICS_LOG_BYTES,
+                      config.METRICS_LOG_BACKUPS)
         job = threading.Timer(1, self._load_recognizer)
         job.start()
 
@@ -86,9 +126,51 @@ class Check(object):
         self.clock_job = threading.Timer(1, self._update_clock)
         self.clock_job.start()
 
+    @staticmethod
+    def instance():
+        """Obtiene la ventana de control de acceso abierta."""
+        return Check._instance
+
+    def update_model(self, added=(), removed=()):
+        """Actualizar el modelo en uso sin detener el reconocimiento.
+
+        Args:
+            added: Lista de (clave, identificador de usuario) nuevos.
+            removed: Lista de claves eliminadas.
+
+        """
+        if self.updater is not None:
+            self.updater.put(added, removed)
+
     def _load_recognizer(self):
         """Iniciar el reconocimiento."""
-        self.recognize = cv.Recognize()
+        cv.Helper.store().compact(config.FACE_STORE_WASTE)
+        self.recognizer = cv.Recognizer.create(config.RECOGNIZER,
+                                               config.RECOGNIZER_THRESHOLD)
+        self.recognizer.read()  # Una vez para todas las puertas
+        self.updater = cv.Updater(self.recognizer, config.MODEL_SAVE_DELAY)
+        self.updater.start()
+        doors = []
+        for options in config.DOORS:
+            sensor = device.Device.sensor(
+                options.get('sensor', config.SENSOR), config.SENSOR_READINGS,
+                options.get('address', 0x5A))
+            thermometer = cv.Thermometer(config.TEMP_OFFSET,
+                                         config.TEMP_AMBIENT_GAIN,
+                                         config.TEMP_REFERENCE,
+                                         config.TEMP_INTERVAL, sensor=sensor)
+            cap = device.Device.camera(options.get('camera', config.CAMERA),
+                                       config.CAMERA_FPS)
+            recognize = cv.Recognize(config.DETECT_SCALE, config.DETECT_ROI,
+                                     config.TRACK_FRAMES, self.recognizer,
+                                     thermometer, cap)
+            recognize.time_offset = config.LOG_TIME_OFFSET
+            recognize.temp_timeout = config.TEMP_TIMEOUT
+            door = cv.Door(options['id'], recognize)
+            door.start()
+            doors.append(door)
+        self.doors = doors
+        self.door = doors[0]
         self.update_canvas()
         self.name.place_forget()
         tk.Button(self.window, text='Administrador', image=self.icon.lock,
@@ -101,56 +183,98 @@ class Check(object):
     def update_canvas(self):
         """Actualizar contenido del canvas contenedor de imagen.
 
-        El canvas muestra la imagen capturada por la cámara, puede
-        detectar un rostro en la imagen.
+        El canvas muestra el último resultado del hilo de detección, la
+        cámara y la detección corren fuera del hilo de la interfaz. También
+        atiende las decisiones de todas las puertas, sigue activo mientras
+        la ventana está oculta.
 
         """
+        if self.canvas_job is not None:
+            self.window.after_cancel(self.canvas_job)  # Un solo ciclo
+            self.canvas_job = None
+        doors = [door for door in self.doors
+                 if not (self.lent and door is self.door)]
+        for door in doors:
+            door.worker.resume()
         if self.label_timer == 0:
-            image = self.recognize.load(True)
             self.label.place_forget()  # Ocultar información
             self.name.place_forget()
+        elif self.label_job is None:
+            self.label_timer -= 1
+        count, image, _ = self.door.worker.result()
+        if not self.lent and image is not None and count != self._painted:
+            self._painted = count  # Dibujar sólo resultados nuevos
+            image = ImageTk.PhotoImage(Image.fromarray(image))
+            self.canvas.image = image  # Evitar el recolector de basura
+            self.canvas.delete('all')  # Limpiar
+            self.canvas.create_image(0, 0, anchor=tk.NW, image=image)
+        delay = 125
+        for door in doors:
+            if door.worker.result()[2]:
+                delay = max(delay, self._decide(door))
+                door.worker.reset()  # Atendida la decisión
+            # La puerta en pantalla espera además que se oculte la etiqueta
+            door.worker.detect = door.ready() and (
+                door is not self.door or self.label_timer == 0)
+        self.canvas_job = self.window.after(delay, self.update_canvas)
+
+    def lend(self, lent=True):
+        """Presta o devuelve la cámara de la puerta en pantalla.
+
+        Args:
+            lent: True detiene el reconocimiento de esa puerta, False lo
+            reanuda.
+
+        """
+        self.lent = lent
+        if lent:
+            self.door.worker.pause()
         else:
-            if self.label_job is None:
-                self.label_timer -= 1
-            image = self.recognize.load(False)
-        image = ImageTk.PhotoImage(Image.fromarray(image))  # Array a Imagen
-        self.canvas.image = image  # Evitar el recolector de basura
-        self.canvas.delete('all')  # Limpiar
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=image)
-        if self.recognize.found_nose:
+            self.update_canvas()
+
+    def _decide(self, door):
+        """Atender la decisión de una puerta.
+
+        Args:
+            door: Puerta con una decisión pendiente.
+
+        Returns:
+            Milisegundos hasta la siguiente actualización del lienzo.
+
+        """
+        recognize = door.recognize
+        name = None
+        if recognize.found_nose:
             cv.Helper.play('sound/mascarilla.mp3')
-            db.DB.event_denied(0)
-            self.label.place(width=260, relx=0.5, x=-130, y=150)
-            self.recognize.reset()
-            self.label_timer = 5
-            self.update_label()
-            self.canvas_job = self.window.after(1000, self.update_canvas)
-        elif self.recognize.found_face:
-            if self.recognize.avg_temp() > 38:
+            self.writer.event_denied(0, door.id)
+            seconds, delay = 5, 1000
+        elif recognize.found_face:
+            if recognize.avg_temp() > 38:
                 cv.Helper.play('sound/temperatura.mp3')
             else:
                 cv.Helper.play('sound/correcto.mp3')
-            user = db.DB.user_by_id(self.recognize.face_of)
-            db.DB.event_insert(user[0][0], self.recognize.avg_temp(),
-                               self.recognize.recog_time(),
-                               self.recognize.gauge_time())
-            self.name.configure(text=user[0][2])
-            self.recognize.reset()
-            self.name.place(width=400, relx=0.5, x=-200, y=400)
-            self.label.place(width=260, relx=0.5, x=-130, y=150)
-            self.label_timer = 5
-            self.update_label()
-            self.canvas_job = self.window.after(1500, self.update_canvas)
-        elif self.recognize.count == 10:
-            cv.Helper.play('sound/denegado.mp3')
-            db.DB.event_denied()
-            self.recognize.reset()
-            self.label_timer = 3
-            self.label.place(width=260, relx=0.5, x=-130, y=150)
-            self.update_label()
-            self.canvas_job = self.window.after(1000, self.update_canvas)
+            user = db.DB.user_by_id(recognize.face_of)
+            self.writer.event_insert(user[0][0], recognize.avg_temp(),
+                                     recognize.recog_time(),
+                                     recognize.gauge_time(), door.id)
+            name = user[0][2]
+            seconds, delay = 5, 1500
         else:
-            self.canvas_job = self.window.after(125, self.update_canvas)
+            cv.Helper.play('sound/denegado.mp3')
+            self.writer.event_denied(1, door.id)
+            seconds, delay = 3, 1000
+        door.hold(seconds)  # Cada puerta espera por su cuenta
+        if door is not self.door:
+            return 125  # Sin pantalla, la puerta mostrada sigue igual
+        if self.label_job is not None:
+            self.label_job.cancel()
+        if name is not None:
+            self.name.configure(text=name)
+            self.name.place(width=400, relx=0.5, x=-200, y=400)
+        self.label.place(width=260, relx=0.5, x=-130, y=150)
+        self.label_timer = seconds
+        self.update_label()
+        return delay
 
     def update_label(self):
         """Actualizar el label cada segundo.
@@ -172,17 +296,20 @@ class Check(object):
             self.label_job.cancel()  # Cancelar pendiente
         if self.clock_job is not None:
             self.clock_job.cancel()  # Cancelar pendiente
+        for door in self.doors:
+            door.stop()  # Detener hilos de la cámara
+        if self.updater is not None:
+            self.updater.stop()  # Guardar el modelo actualizado
+        self.writer.stop()  # Escribir eventos pendientes
+        metrics.Metrics.instance().stop()
         self.root.destroy()  # Cerrar ventanas
 
     def _on_press_login(self):
         """Abrir login. """
-        if self.canvas_job is not None:
-            self.window.after_cancel(self.canvas_job)  # Cancelar pendiente
-            self.canvas_job = None
         if self.label_job is not None:
             self.label_job.cancel()  # Cancelar pendiente
             self.label_job = None
-        self.name.place_forget()
+        self.name.place_forget()  # Las puertas siguen reconociendo
         Login(self)
 
 
@@ -267,6 +394,13 @@ class Menu(object):
         parent: Objeto padre.
         window: Interfaz gráfica del menu.
         id: Identificador de usuario que inició sesión.
+        _training: Entrenamiento en curso o None.
+        _loading: Lectura en segundo plano del modelo entrenado o None.
+        _job: Consulta pendiente del avance del entrenamiento o None.
+        _progress: Etiqueta con el avance del entrenamiento.
+        _cancel: Botón para cancelar el entrenamiento.
+        _task: Sincronización o respaldo en curso, o None.
+        _status: Etiqueta con el avance de la sincronización o respaldo.
 
     Methods:
         _on_press_close
@@ -274,11 +408,25 @@ class Menu(object):
         _on_press_pass
         _on_press_date
         _on_press_train
+        _update_training
+        _update_loading
+        _end_training
+        _on_press_cancel
         _on_press_sync
+        _on_press_backup
+        _start_task
+        _update_task
     """
     parent = None
     window = None
     id = None
+    _training = None
+    _loading = None
+    _job = None
+    _progress = None
+    _cancel = None
+    _task = None
+    _status = None
 
     def __init__(self, parent, id):
         self.parent = parent
@@ -301,18 +449,29 @@ class Menu(object):
                   compound='left', anchor='w', command=self._on_press_date
                   ).grid(row=2, column=0, sticky='we')
         tk.Button(self.window, image=parent.icon.train,
-                  text='Entrenar y salir', compound='left', anchor='w',
+                  text='Entrenar', compound='left', anchor='w',
                   command=self._on_press_train).grid(row=3, column=0,
                                                      sticky='we')
         tk.Button(self.window, text='Sincronizar', compound='left', anchor='w',
                   image=parent.icon.sync, command=self._on_press_sync
                   ).grid(row=4, column=0, sticky='we')
+        tk.Button(self.window, text='Respaldar', compound='left',
+                  anchor='w', image=parent.icon.disk,
+                  command=self._on_press_backup
+                  ).grid(row=5, column=0, sticky='we')
         tk.Button(self.window, text='Salir', compound='left', anchor='w',
                   image=parent.icon.exit, command=self._on_press_close
-                  ).grid(row=5, column=0, sticky='we')
+                  ).grid(row=6, column=0, sticky='we')
 
     def _on_press_close(self):
         """Al cerrar la ventana."""
+        if self._job is not None:
+            self.window.after_cancel(self._job)  # Cancelar pendiente
+            self._job = None
+        if self._training is not None:
+            self._training.cancel()  # Cancelar pendiente
+            self._training = None
+        self._loading = None  # La lectura termina sola y pone el modelo
         self.parent.window.deiconify()  # Restaurar ventana
         self.parent.update_canvas()  # Actualizar lienzo
         self.window.destroy()
@@ -337,24 +496,117 @@ class Menu(object):
         if tk.messagebox.askyesno(title, message, parent=self.window):
             for child in self.window.winfo_children():
                 child.configure(state=tk.DISABLED)
-            cv.Train()
-            for child in self.window.winfo_children():
-                child.configure(state=tk.NORMAL)
+            self._progress = tk.Label(self.window, text='Iniciando ...')
+            self._progress.grid(row=7, column=0, sticky='we')
+            self._cancel = tk.Button(self.window, text='Cancelar',
+                                     compound='left', anchor='w',
+                                     image=self.parent.icon.back,
+                                     command=self._on_press_cancel)
+            self._cancel.grid(row=8, column=0, sticky='we')
+            self._training = cv.Training(config.RECOGNIZER)
+            self._training.start()
+            self._update_training()
+
+    def _update_training(self):
+        """Mostrar el avance del entrenamiento cada 200 milisegundos."""
+        self._job = None
+        if self._training is None:
+            return  # Cancelado
+        alive = self._training.alive()  # Antes de leer los últimos mensajes
+        for phase, done, total, eta in self._training.poll():
+            text = f'{phase} {done}/{total}'
+            if eta is not None:
+                text += f', faltan {eta} s'
+            self._progress.configure(text=text)
+        if self._training.finished:
+            self._training = None
+            self._progress.configure(text='Cargando el modelo ...')
+            self._cancel.configure(state=tk.DISABLED)
+            # Leer el modelo fuera de la interfaz, se pone en uso al terminar
+            executor = ThreadPoolExecutor(1)
+            self._loading = executor.submit(self.parent.recognizer.read)
+            executor.shutdown(wait=False)
+            self._update_loading()
+        elif self._training.error is not None or not alive:
+            message = self._training.error or 'El proceso terminó.'
+            self._end_training()
+            tk.messagebox.showerror('Error al entrenar', message,
+                                    parent=self.window)
+        else:
+            self._job = self.window.after(200, self._update_training)
+
+    def _update_loading(self):
+        """Esperar cada 200 milisegundos a que se lea el modelo nuevo."""
+        self._job = None
+        if self._loading is None:
+            return  # Menú cerrado
+        if not self._loading.done():
+            self._job = self.window.after(200, self._update_loading)
+            return
+        error = self._loading.exception()
+        self._loading = None
+        self._end_training()
+        if error is None:
             tk.messagebox.showinfo('Ejecutado correctamente',
-                                   'Debe volver a iniciar la aplicación.',
+                                   'El modelo entrenado ya está en uso.',
                                    parent=self.window)
-            self.window.destroy()
-            self.parent.root.destroy()
+        else:
+            tk.messagebox.showerror('Error al cargar el modelo', str(error),
+                                    parent=self.window)
+
+    def _end_training(self):
+        """Quitar el avance y habilitar el menú."""
+        self._training = None
+        self._progress.destroy()
+        self._cancel.destroy()
+        for child in self.window.winfo_children():
+            child.configure(state=tk.NORMAL)
+
+    def _on_press_cancel(self):
+        """Al presionar sobre cancelar el entrenamiento."""
+        self._training.cancel()
+        self._end_training()
 
     def _on_press_sync(self):
         """Al presionar sobre sincronizar."""
-        myurl = 'https://edisonat.com/main/sync'
-        files = {'db': open('db.db', 'rb')}
-        nav = 'Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:47.0)' \
-              'Gecko/20100101 Firefox/47.0'
-        getdata = requests.post(myurl, files=files, data={'_token': '-'},
-                                headers={'User-Agent': nav})
-        print(getdata.text)
+        self._start_task(sync.Sync(config.SYNC_URL), 'Sincronizando ...')
+
+    def _on_press_backup(self):
+        """Al presionar sobre respaldar."""
+        self._start_task(sync.Backup(config.BACKUP_DIR, config.BACKUP_KEEP),
+                         'Respaldando ...')
+
+    def _start_task(self, task, text):
+        """Ejecutar una sincronización o respaldo en segundo plano.
+
+        Args:
+            task: Objeto con start, alive, status y error.
+            text: Texto inicial del avance.
+        """
+        if self._task is not None and self._task.alive():
+            return  # Ya hay una en curso
+        self._status = tk.Label(self.window, text=text)
+        self._status.grid(row=9, column=0, sticky='we')
+        self._task = task
+        self._task.start()
+        self._update_task()
+
+    def _update_task(self):
+        """Mostrar el avance de la tarea cada 200 milisegundos."""
+        if not self._status.winfo_exists():
+            return  # Menú cerrado
+        if self._task.status:
+            self._status.configure(text=self._task.status)
+        if self._task.alive():
+            self.window.after(200, self._update_task)
+            return
+        self._status.destroy()
+        if self._task.error is not None:
+            tk.messagebox.showerror('Error', self._task.error,
+                                    parent=self.window)
+        else:
+            tk.messagebox.showinfo('Ejecutado correctamente',
+                                   self._task.status, parent=self.window)
 
 
 class Date(object):
@@ -516,6 +768,10 @@ class UserPass(object):
 class UserList(object):
     """Listar usuarios..
 
+    Los usuarios se leen por páginas a medida que se desplaza la tabla. La
+    búsqueda filtra en la base de datos por el inicio del nombre o del DNI
+    cuando se deja de escribir.
+
     Args:
         parent: Objeto que invoca a este objeto.
 
@@ -527,8 +783,18 @@ class UserList(object):
         _delete: Botón Eliminar de cada usuario.
         _icon: Set de íconos.
         _pics: Botón mostrar rostros.
+        _query: Texto de búsqueda.
+        _count: Etiqueta con el número de usuarios encontrados.
+        _scroll: Barra de desplazamiento de la tabla.
+        _last: (name, id) del último usuario leído o None.
+        _more: ¿Quedan usuarios por leer?
+        _search_job: Búsqueda pendiente mientras se escribe.
 
     Methods:
+        _search
+        _load_more
+        _on_scroll
+        _on_type
         _on_select
         _on_press_delete
         _on_press_add
@@ -541,6 +807,10 @@ class UserList(object):
     table = None
     _edit = None
     _delete = None
+    PAGE = 100  # Usuarios por lectura
+    _last = None
+    _more = False
+    _search_job = None
 
     def __init__(self, parent):
         self._icon = theme.Icon.instance()
@@ -555,8 +825,8 @@ class UserList(object):
         self.window.columnconfigure(1, weight=1)
         self.window.columnconfigure(2, weight=1)
         self.window.columnconfigure(3, weight=1)
-        self.window.rowconfigure(0, pad=10)  # Las 2 filas
-        self.window.rowconfigure(1, weight=1)
+        self.window.rowconfigure(0, pad=10)  # Las 3 filas
+        self.window.rowconfigure(2, weight=1)
         # Los botones de la parte superior
         tk.Button(self.window, text='Volver', compound='left',
                   image=self._icon.back, command=self._on_press_close
@@ -580,6 +850,13 @@ class UserList(object):
                                  image=self._icon.delete,
                                  command=self._on_press_delete)
         self._delete.grid(row=0, column=4, ipadx=5)
+        # La búsqueda
+        board = Board(self.window)
+        self._query = tk.StringVar()
+        search = tk.Entry(self.window, textvariable=self._query)
+        search.grid(row=1, column=0, columnspan=5, sticky='we')
+        search.bind('<Button-1>', board.show)
+        self._query.trace_add('write', self._on_type)
         # La tabla
         self.table = tk.ttk.Treeview(
             self.window, columns=('#1', '#2', '#3'), selectmode=tk.BROWSE)
@@ -590,26 +867,59 @@ class UserList(object):
         self.table.column('#1', width=80, stretch=False)  # Anchos
         self.table.column('#2', width=45, stretch=False)
         self.table.column('#3', width=45, stretch=False)
-        self.table.grid(row=1, column=0, columnspan=5, sticky='nsew')
-        scroll = tk.ttk.Scrollbar(self.window, orient="vertical",
-                                  command=self.table.yview)  # table a scroll
-        scroll.grid(row=1, column=5, sticky='snew')
-        self.table.configure(yscrollcommand=scroll.set)  # scroll a table
-        data = db.DB.user_list()  # Consulta bd
-        tk.Label(self.window, text=f'{len(data)} registros').grid(
-            row=2, column=0, columnspan=4)
+        self.table.grid(row=2, column=0, columnspan=5, sticky='nsew')
+        self._scroll = tk.ttk.Scrollbar(self.window, orient="vertical",
+                                        command=self.table.yview)
+        self._scroll.grid(row=2, column=5, sticky='snew')
+        self.table.configure(yscrollcommand=self._on_scroll)
+        self._count = tk.Label(self.window)
+        self._count.grid(row=3, column=0, columnspan=4)
+        self.table.bind('<<TreeviewSelect>>', self._on_select)
+        self._search()
+
+    def _search(self):
+        """Mostrar desde el inicio los usuarios que coinciden."""
+        self._search_job = None
+        self.table.delete(*self.table.get_children())
+        text = self._query.get()
+        self._count.configure(text=f'{db.DB.user_count(text)} registros')
+        self._last = None
+        self._more = True
+        self._load_more()
+
+    def _load_more(self):
+        """Agregar a la tabla la siguiente página de usuarios."""
+        data = db.DB.user_search(self._query.get(), self._last, self.PAGE)
+        self._more = len(data) == self.PAGE
         for row in data:
+            if self.table.exists(row[0]):
+                continue  # Agregado o editado a mano, ya está en la tabla
             admin = '*' if row[3] == 'Administrador' else ''
             self.table.insert(
                 '', tk.END, iid=row[0], text=row[2], values=(row[1], admin,
                                                              row[5]))
-        self.table.bind('<<TreeviewSelect>>', self._on_select)
+        if len(data):
+            self._last = (data[-1][2], data[-1][0])
+
+    def _on_scroll(self, first, last):
+        """Al desplazar la tabla, leer más usuarios cerca del final."""
+        self._scroll.set(first, last)
+        if self._more and float(last) > 0.9:
+            self._load_more()
+
+    def _on_type(self, *args):
+        """Al escribir en la búsqueda, esperar a que termine de escribir."""
+        if self._search_job is not None:
+            self.window.after_cancel(self._search_job)
+        self._search_job = self.window.after(300, self._search)
 
     def _on_select(self, event):
         """Al seleccionar item de la tabla."""
-        self._edit.configure(state=tk.NORMAL)  # Habilitar botones
-        self._delete.configure(state=tk.NORMAL)
-        self._pics.configure(state=tk.NORMAL)
+        # Habilitar botones, una nueva búsqueda quita la selección
+        state = tk.NORMAL if len(self.table.selection()) else tk.DISABLED
+        self._edit.configure(state=state)
+        self._delete.configure(state=state)
+        self._pics.configure(state=state)
 
     def _on_press_delete(self):
         """Al presionar eliminar. """
@@ -624,7 +934,9 @@ class UserList(object):
                 self._delete.configure(state=tk.DISABLED)
                 self._pics.configure(state=tk.DISABLED)
                 db.DB.user_delete(id[0])
-                cv.Helper.remove_dir('data/' + str(id[0]))
+                pics = cv.Helper.get_pics(str(id[0]))
+                cv.Helper.remove_pics(str(id[0]))
+                Check.instance().update_model(removed=pics)
 
     def _on_press_add(self):
         """Al presionar agregar. """
@@ -651,6 +963,10 @@ class UserList(object):
 class UserPics(object):
     """Listar rostros de un usuario.
 
+    Muestra los rostros por páginas. Las imágenes se decodifican en un hilo
+    aparte y se guardan las más recientes, así cambiar de página o eliminar
+    un rostro no vuelve a leer todos los archivos.
+
     Args:
         parent: Objeto que invoca a este objeto.
 
@@ -658,14 +974,37 @@ class UserPics(object):
         _icon: Set de íconos.
         parent: Objeto padre.
         window: Interfaz gráfica para listar rostros.
+        _pics: Claves de los rostros del usuario.
+        _page: Página mostrada.
+        _tiles: Botones de los rostros de la página.
+        _blank: Imagen vacía mientras se decodifica un rostro.
+        _cache: Imágenes recientes por (clave, versión).
+        _pending: Claves que se están decodificando.
+        _decoded: Cola de imágenes decodificadas.
+        _executor: Hilo que decodifica las imágenes.
+        _poll_job: Llamada pendiente para revisar la cola.
+        _prev: Botón de la página anterior.
+        _next: Botón de la página siguiente.
+        _pages: Etiqueta con el número de página.
 
     Methods:
         update
+        _show
+        _load
+        _decode
+        _poll
+        _on_press_prev
+        _on_press_next
         _on_press_delete
         _on_press_add
         _on_press_close
 
     """
+    PAGE = 9  # Rostros por página, 3 x 3
+    CACHE = 36  # Imágenes que se conservan
+    _pics = []
+    _page = 0
+    _poll_job = None
 
     def __init__(self, parent):
         self._icon = theme.Icon.instance()
@@ -685,48 +1024,161 @@ class UserPics(object):
         tk.Button(self.window, text='Capturar', compound='right',
                   image=self._icon.camera, command=self._on_press_add
                   ).grid(row=0, column=1, ipadx=10)
-        self._frame = None
+        frame = tk.Frame(self.window)
+        frame.grid(row=1, column=0, columnspan=2, sticky='EW')
+        for col in range(3):
+            frame.columnconfigure(col, weight=1)
+        self._blank = tk.PhotoImage(width=150, height=150)
+        self._tiles = []
+        for i in range(self.PAGE):
+            tile = tk.Button(frame, image=self._blank, bg='white')
+            tile.grid(row=i // 3, column=i % 3)
+            tile.path = None
+            tile.key = None
+            tile.bind('<Button-1>', self._on_press_delete)
+            self._tiles.append(tile)
+        nav = tk.Frame(self.window)
+        nav.grid(row=2, column=0, columnspan=2, sticky='EW')
+        nav.columnconfigure(1, weight=1)
+        self._prev = tk.Button(nav, image=self._icon.back,
+                               command=self._on_press_prev)
+        self._prev.grid(row=0, column=0)
+        self._pages = tk.Label(nav)
+        self._pages.grid(row=0, column=1)
+        self._next = tk.Button(nav, image=self._icon.next,
+                               command=self._on_press_next)
+        self._next.grid(row=0, column=2)
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._decoded = queue.Queue()
+        self._executor = ThreadPoolExecutor(1)
         self.update()
 
     def update(self):
         """Actualizar la lista de rostros."""
-        if self._frame is not None:
-            self._frame.destroy()
-        self._frame = tk.Frame(self.window)
-        self._frame.grid(row=1, column=0, columnspan=2, sticky='EW')
-        self._frame.columnconfigure(0, weight=1)
-        self._frame.columnconfigure(1, weight=1)
-        self._frame.columnconfigure(2, weight=1)
-        pics = cv.Helper.get_pics(str(self.parent.table.selection()[0]))
-        col = 0
-        row = 0
+        self._pics = cv.Helper.get_pics(str(self.parent.table.selection()[0]))
+        self._show()
+
+    def _show(self):
+        """Mostrar la página actual, decodificar la siguiente de antemano."""
+        pages = max(1, -(-len(self._pics) // self.PAGE))
+        self._page = min(self._page, pages - 1)
+        start = self._page * self.PAGE
+        pics = self._pics[start:start + self.PAGE]
+        keys = self._load(pics)
+        for i, tile in enumerate(self._tiles):
+            if i < len(pics):
+                tile.path = pics[i]
+                tile.key = keys[i]
+                image = self._cache.get(tile.key, self._blank)
+                tile.configure(image=image, bg='white')
+                tile.grid()
+            else:
+                tile.path = None
+                tile.grid_remove()
+        self._pages.configure(text=f'{self._page + 1}/{pages}')
+        self._prev.configure(
+            state=tk.NORMAL if self._page > 0 else tk.DISABLED)
+        self._next.configure(
+            state=tk.NORMAL if self._page < pages - 1 else tk.DISABLED)
+        end = start + self.PAGE
+        self._load(self._pics[end:end + self.PAGE])  # Página siguiente
+
+    def _load(self, pics):
+        """Encargar la decodificación de los rostros que no están guardados.
+
+        Args:
+            pics: Claves de los rostros.
+
+        Returns:
+            Clave (rostro, versión) de cada rostro.
+
+        """
+        keys = []
+        faces = cv.Helper.store()
         for pic in pics:
-            image = ImageTk.PhotoImage(Image.open(pic))
-            delete = tk.Button(self._frame, image=image, bg='white')
-            delete.grid(row=row, column=col)
-            delete.image = image
-            delete.path = pic
-            delete.bind('<Button-1>', self._on_press_delete)
-            col += 1
-            if col % 3 == 0:
-                col = 0
-                row += 1
+            key = (pic, faces.version(pic) or 0)  # 0 eliminado, vacío
+            keys.append(key)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            elif key not in self._pending:
+                self._pending.add(key)
+                self._executor.submit(self._decode, key)
+        if self._pending and self._poll_job is None:
+            self._poll_job = self.window.after(50, self._poll)
+        return keys
+
+    def _decode(self, key):
+        """Leer un rostro, se ejecuta en el hilo de decodificación.
+
+        Las fotos en archivos se muestran a color, los rostros del paquete
+        sólo se guardan en grises.
+
+        """
+        image = None
+        if isinstance(cv.Helper.store(), store.PackStore):
+            gray = cv.Helper.read_pic(key[0])
+            if gray is not None:
+                image = Image.fromarray(gray)
+        else:
+            try:
+                image = Image.open(key[0])
+                image.load()  # Decodificar aquí y no en la interfaz
+            except OSError:
+                image = None
+        self._decoded.put((key, image))
+
+    def _poll(self):
+        """Poner en los botones las imágenes ya decodificadas."""
+        self._poll_job = None
+        while True:
+            try:
+                key, image = self._decoded.get_nowait()
+            except queue.Empty:
+                break
+            self._pending.discard(key)
+            if image is None:
+                continue
+            self._cache[key] = ImageTk.PhotoImage(image)
+            while len(self._cache) > self.CACHE:
+                self._cache.popitem(last=False)
+            for tile in self._tiles:
+                if tile.key == key and tile.path is not None:
+                    tile.configure(image=self._cache[key])
+        if self._pending:
+            self._poll_job = self.window.after(50, self._poll)
+
+    def _on_press_prev(self):
+        """Al presionar sobre la página anterior."""
+        self._page -= 1
+        self._show()
+
+    def _on_press_next(self):
+        """Al presionar sobre la página siguiente."""
+        self._page += 1
+        self._show()
 
     def _on_press_delete(self, event):
         """Al presionar sobre eliminar rostro."""
+        tile = event.widget
+        if tile.path is None:
+            return
         title = 'Eliminar imagen'
         message = '¿Desea eliminar esta imagen?'
-        event.widget.configure(bg='yellow')
+        tile.configure(bg='yellow')
         if tk.messagebox.askyesno(title, message, parent=self.window):
-            cv.Helper.remove_file(event.widget.path)
+            cv.Helper.remove_pic(tile.path)
+            Check.instance().update_model(removed=[tile.path])
             id = self.parent.table.selection()[0]
             db.DB.user_pic_delete(str(id))
             values = self.parent.table.item(id, 'values')
             self.parent.table.item(id, values=(
                 values[0], values[1], int(values[2]) - 1))
-            self.update()
+            self._pics.remove(tile.path)
+            self._cache.pop(tile.key, None)
+            self._show()  # Los siguientes avanzan, del caché si ya están
         else:
-            event.widget.configure(bg='white')
+            tile.configure(bg='white')
 
     def _on_press_add(self):
         """Al presionar sobre agregar rostro."""
@@ -734,6 +1186,9 @@ class UserPics(object):
 
     def _on_press_close(self):
         """Al cerrar ventana. """
+        if self._poll_job is not None:
+            self.window.after_cancel(self._poll_job)  # Cancelar pendiente
+        self._executor.shutdown(wait=False)
         self.parent.window.deiconify()
         self.window.destroy()
         del self
@@ -779,8 +1234,13 @@ class AddFace(object):
         self._window.focus_force()  # Foco en la ventana
         self._canvas = tk.Canvas(self._window, width=480, height=640)
         self._canvas.pack()  # Crear y ubicar canvas
+        quality = cv.Quality(config.CAPTURE_SHARPNESS,
+                             config.CAPTURE_BRIGHTNESS,
+                             config.CAPTURE_SYMMETRY,
+                             config.CAPTURE_DUPLICATE)
         self._capture = cv.Capture(str(parent.parent.table.selection()[0]),
-                                   parent.parent.parent.parent.recognize.cap)
+                                   Check.instance().door.grabber, quality)
+        Check.instance().lend()  # La cámara de la puerta en pantalla
         tk.Button(self._window, text='Volver', image=self._icon.back,
                   compound='left', command=self._on_press_close).pack(ipadx=10)
         self._label = tk.Label(
@@ -843,6 +1303,11 @@ class AddFace(object):
         if self._label_job is not None:
             self._label_job.cancel()  # Cancelar pendiente
             self._label_job = None
+        if self._capture.saved:  # Agregar los rostros nuevos al modelo
+            id = int(self._parent.parent.table.selection()[0])
+            Check.instance().update_model(
+                added=[(path, id) for path in self._capture.saved])
+        Check.instance().lend(False)  # Devolver la cámara a la puerta
         self._parent.window.deiconify()  # Cerrar ventanas
         self._parent.update()
         self._window.destroy()
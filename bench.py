@@ -0,0 +1,280 @@
+"""Mide el rendimiento del reconocimiento facial.
+
+Entrena con parte de los rostros de data/ y mide la precisión con el resto,
+luego reproduce sesiones grabadas en cv.Recognize y mide la duración de
+cada etapa y los cuadros que toma llegar a una decisión. Cada opción
+--config es una configuración distinta y se muestran lado a lado.
+
+Example:
+    python3 bench.py --session video:puerta.mp4@10 --session synthetic \\
+        --config scale=1 --config scale=0.5,track=0 --json actual.json
+
+Classes:
+    Bench
+
+"""
+import argparse
+import json
+import os
+import tempfile
+from shutil import rmtree
+from time import perf_counter
+import numpy as np
+import config
+import cv
+import device
+
+
+class Bench(object):
+    """Mide una configuración del reconocimiento.
+
+    Args:
+        options: Diccionario con recognizer, threshold, scale, roi y track,
+        las claves ausentes toman el valor de config.
+
+    Attributes:
+        _options: Configuración medida.
+        _folder: Carpeta temporal del modelo entrenado.
+        _recognizer: Algoritmo entrenado sin los rostros de prueba.
+        results: Métricas obtenidas.
+
+    Methods:
+        parse
+        summary
+        accuracy
+        session
+        close
+        report
+
+    """
+    _options = None
+    _folder = None
+    _recognizer = None
+    results = None
+
+    def __init__(self, options):
+        self._options = {'recognizer': config.RECOGNIZER,
+                         'threshold': config.RECOGNIZER_THRESHOLD,
+                         'scale': config.DETECT_SCALE,
+                         'roi': config.DETECT_ROI,
+                         'track': config.TRACK_FRAMES}
+        self._options.update(options)
+        self._folder = tempfile.mkdtemp(prefix='bench-')
+        ext = '.xml' if self._options['recognizer'] == 'eigen' else '.npz'
+        self._recognizer = cv.Recognizer.create(
+            self._options['recognizer'], self._options['threshold'],
+            os.path.join(self._folder, 'model' + ext))
+        self.results = {}
+
+    @staticmethod
+    def parse(text):
+        """Lee una configuración escrita como clave=valor,clave=valor.
+
+        Args:
+            text: Texto de la configuración, por ejemplo 'scale=0.5'.
+
+        Returns:
+            Diccionario de opciones.
+
+        Raises:
+            ValueError: Si una clave no es una opción conocida.
+
+        """
+        options = {}
+        for item in filter(None, text.split(',')):
+            key, _, value = item.partition('=')
+            if key not in ['recognizer', 'threshold', 'scale', 'roi',
+                           'track']:
+                raise ValueError('Opción desconocida: ' + key)
+            if key == 'recognizer':
+                options[key] = value
+            elif key == 'roi':
+                options[key] = tuple(int(v) for v in value.split(':')) \
+                    if value != 'none' else None
+            elif key == 'track':
+                options[key] = int(value)
+            else:
+                options[key] = float(value) if value != 'none' else None
+        return options
+
+    @staticmethod
+    def summary(values):
+        """Promedio, mediana y percentil 95 en milisegundos.
+
+        Args:
+            values: Duraciones en segundos.
+
+        Returns:
+            Texto 'promedio / p50 / p95' o '-' sin valores.
+
+        """
+        if not len(values):
+            return '-'
+        ms = np.array(values) * 1000
+        mean, p50, p95 = ms.mean(), *np.percentile(ms, [50, 95])
+        return f'{mean:.1f} / {p50:.1f} / {p95:.1f}'
+
+    def accuracy(self, holdout=5, progress=None):
+        """Entrena sin uno de cada `holdout` rostros y predice esos rostros.
+
+        Args:
+            holdout: Se reserva para prueba uno de cada `holdout` rostros de
+            cada usuario.
+            progress: Función (fase, hechos, total) que recibe el avance.
+
+        """
+        faces = cv.Train.faces()
+        data, labels, keys = cv.Dataset().load(faces, progress)
+        labels = np.asarray(labels)
+        seen = {}
+        test = np.zeros(len(labels), bool)
+        for i, label in enumerate(labels):
+            seen[label] = seen.get(label, -1) + 1
+            test[i] = seen[label] % holdout == holdout - 1
+        train = np.flatnonzero(~test)
+        start = perf_counter()
+        self._recognizer.train(data[train], labels[train].tolist(),
+                               [keys[i] for i in train], progress)
+        self.results['entrenamiento (s)'] = \
+            f'{perf_counter() - start:.1f}'
+        times = []
+        correct = wrong = rejected = 0
+        for i in np.flatnonzero(test):
+            start = perf_counter()
+            label, distance = self._recognizer.predict(data[i])
+            times.append(perf_counter() - start)
+            if distance >= self._recognizer.threshold:
+                rejected += 1
+            elif label == labels[i]:
+                correct += 1
+            else:
+                wrong += 1
+        total = max(len(times), 1)
+        self.results['rostros de prueba'] = len(times)
+        self.results['aciertos'] = f'{correct / total:.1%}'
+        self.results['aceptados por error'] = f'{wrong / total:.1%}'
+        self.results['rechazados'] = f'{rejected / total:.1%}'
+        self.results['predict (ms)'] = Bench.summary(times)
+
+    def session(self, source, expect=None, frames=300):
+        """Reproduce una sesión grabada en el reconocimiento.
+
+        Args:
+            source: Fuente de cuadros como en config.CAMERA.
+            expect: Usuario esperado en la sesión, 0 si nadie debe ser
+            reconocido, None si no se conoce.
+            frames: Cuadros que se procesan.
+
+        """
+        stages = {}
+        thermometer = cv.Thermometer(
+            config.TEMP_OFFSET, sensor=device.FakeSensor([26.3]))
+        recognize = cv.Recognize(self._options['scale'],
+                                 self._options['roi'], self._options['track'],
+                                 self._recognizer, thermometer,
+                                 device.Device.camera(source, 0))
+        recognize.probe = lambda stage, seconds: \
+            stages.setdefault(stage, []).append(seconds)
+        decisions = []
+        count = 0
+        start = perf_counter()
+        for _ in range(frames):
+            recognize.load(True)
+            count += 1
+            if recognize.done():
+                if recognize.found_nose:
+                    decisions.append((count, 'mascarilla'))
+                elif recognize.found_face:
+                    decisions.append((count, int(recognize.face_of)))
+                else:
+                    decisions.append((count, 0))
+                count = 0
+                recognize.reset()
+        elapsed = perf_counter() - start
+        thermometer.stop()
+        recognize.cap.release()
+        name = source if expect is None else f'{source}@{expect}'
+        self.results[f'{name} fps'] = f'{frames / elapsed:.1f}'
+        self.results[f'{name} decisiones'] = len(decisions)
+        if decisions:
+            self.results[f'{name} cuadros por decisión'] = \
+                f'{np.mean([n for n, _ in decisions]):.1f}'
+        if decisions and expect is not None:
+            hits = sum(1 for _, who in decisions if who == expect)
+            self.results[f'{name} decisiones correctas'] = \
+                f'{hits / len(decisions):.1%}'
+        for stage in ['preprocess', 'track', 'face', 'eye', 'nose',
+                      'predict']:
+            self.results[f'{name} {stage} (ms)'] = \
+                Bench.summary(stages.get(stage, []))
+
+    def close(self):
+        """Borra el modelo temporal."""
+        rmtree(self._folder, ignore_errors=True)
+
+    @staticmethod
+    def report(runs):
+        """Muestra las métricas de cada configuración lado a lado.
+
+        Args:
+            runs: Diccionario nombre de configuración -> métricas.
+
+        """
+        rows = []
+        for results in runs.values():
+            rows += [key for key in results if key not in rows]
+        names = list(runs)
+        width = max(len(row) for row in rows) if rows else 0
+        cols = [max(len(name), 20) for name in names]
+        print(' ' * width, *[n.rjust(c) for n, c in zip(names, cols)])
+        for row in rows:
+            print(row.ljust(width), *[str(runs[n].get(row, '')).rjust(c)
+                                      for n, c in zip(names, cols)])
+
+
+def main():
+    """Ejecuta las mediciones indicadas en la línea de comandos."""
+    parser = argparse.ArgumentParser(
+        description='Mide el rendimiento del reconocimiento facial.')
+    parser.add_argument('--config', action='append', default=[],
+                        help='clave=valor,... (recognizer, threshold, scale, '
+                             'roi=x1:y1:x2:y2, track), se puede repetir')
+    parser.add_argument('--session', action='append', default=[],
+                        help='fuente de cuadros como config.CAMERA, con '
+                             '@usuario esperado (0 nadie), se puede repetir')
+    parser.add_argument('--frames', type=int, default=300,
+                        help='cuadros por sesión')
+    parser.add_argument('--holdout', type=int, default=5,
+                        help='se prueba uno de cada N rostros de data/')
+    parser.add_argument('--json', help='guardar los resultados en un archivo')
+    parser.add_argument('--baseline', help='resultados guardados con --json '
+                                           'para comparar')
+    args = parser.parse_args()
+    runs = {}
+    if args.baseline:
+        with open(args.baseline) as file:
+            runs = {'base ' + k: v for k, v in json.load(file).items()}
+    current = {}
+    for text in args.config or ['']:
+        bench = Bench(Bench.parse(text))
+        try:
+            bench.accuracy(args.holdout)
+            for session in args.session:
+                source, _, expect = session.rpartition('@')
+                if not source or not expect.isdigit():
+                    source, expect = session, None
+                source = int(source) if source.isdigit() else source
+                bench.session(source, None if expect is None else
+                              int(expect), args.frames)
+        finally:
+            bench.close()
+        current[text or 'config.py'] = bench.results
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(current, file, indent=1)
+    runs.update(current)
+    Bench.report(runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Configuración de la aplicación.
+
+Valores que ajustan el funcionamiento del control de acceso sin modificar
+el código de los demás módulos.
+
+"""
+# Fuente de cuadros: número de cámara, 'video:archivo', 'images:carpeta' o
+# 'synthetic' ('synthetic:imagen' dibuja ese rostro). CAMERA_FPS limita el
+# ritmo de las fuentes simuladas, 0 entrega cuadros sin pausa.
+CAMERA = 0
+CAMERA_FPS = 30
+
+# Sensor de temperatura: 'mlx90614' o 'fake', que repite SENSOR_READINGS.
+SENSOR = 'mlx90614'
+SENSOR_READINGS = [26.3]
+
+# Puertas atendidas por este equipo, cada una con su cámara y su sensor
+# (dirección I2C propia si comparten el bus). El id se guarda en cada evento
+# y la primera puerta es la que se muestra en pantalla. Por ejemplo, una
+# segunda entrada: {'id': 2, 'camera': 1, 'sensor': 'mlx90614',
+# 'address': 0x5B}.
+DOORS = [{'id': 1, 'camera': CAMERA, 'sensor': SENSOR, 'address': 0x5A}]
+
+# Factor con el que se reduce la imagen en grises antes de buscar rostros,
+# 1 busca en la imagen completa. Con el tamaño mínimo de 480x480 el
+# clasificador ya descarta casi toda la pirámide, reducir conviene cuando
+# la cámara entrega más resolución.
+DETECT_SCALE = 1
+
+# Región (x1, y1, x2, y2) del cuadro de 480x640 en la que se buscan rostros,
+# None busca en todo el cuadro. Un rostro debe medir al menos 480x480.
+DETECT_ROI = None
+
+# Cuadros seguidos en los que se sigue un rostro ya verificado sin volver a
+# ejecutar los clasificadores de rostro, ojos y nariz, 0 no sigue rostros.
+TRACK_FRAMES = 4
+
+# Algoritmo de reconocimiento: 'eigen' (Eigenfaces) o 'embedding' (vectores
+# de rasgos de la red models/face.onnx con búsqueda del vecino más cercano).
+RECOGNIZER = 'eigen'
+
+# Distancia máxima para aceptar un rostro, None usa la del algoritmo.
+RECOGNIZER_THRESHOLD = None
+
+# Segundos sin agregar ni eliminar rostros tras los que se guarda en disco
+# el modelo actualizado; también se guarda al cerrar.
+MODEL_SAVE_DELAY = 30
+
+# Calidad mínima de los rostros que se guardan al capturar: varianza del
+# laplaciano (nitidez), brillo promedio (mínimo, máximo), diferencia máxima
+# entre la mitad izquierda y la derecha reflejada (0 a 1) y bits distintos
+# del hash perceptual con los que un rostro cuenta como repetido.
+CAPTURE_SHARPNESS = 100
+CAPTURE_BRIGHTNESS = (60, 200)
+CAPTURE_SYMMETRY = 0.3
+CAPTURE_DUPLICATE = 4
+
+# Almacenamiento de los rostros: 'files' guarda un JPEG por rostro en
+# data/<usuario>/, 'pack' los guarda todos en data/faces.pack (importe los
+# existentes con python3 store.py import). Al iniciar se compacta el paquete
+# si los rostros eliminados ocupan al menos FACE_STORE_WASTE de él.
+FACE_STORE = 'files'
+FACE_STORE_WASTE = 0.25
+
+# Grados que se suman a la lectura del sensor de temperatura.
+TEMP_OFFSET = 10.68
+
+# Compensación por cada grado que el ambiente está bajo TEMP_REFERENCE,
+# 0 no compensa. TEMP_REFERENCE es el ambiente en el que se calibró
+# TEMP_OFFSET.
+TEMP_AMBIENT_GAIN = 0
+TEMP_REFERENCE = 25
+
+# Segundos entre lecturas del sensor de temperatura.
+TEMP_INTERVAL = 0.05
+
+# Segundos que se espera una temperatura estable después de reconocer un
+# rostro; pasado ese tiempo se registra la estimación disponible.
+TEMP_TIMEOUT = 2
+
+# Segundos que se suman a los tiempos de reconocimiento y de toma de
+# temperatura guardados en cada evento, mantiene comparables los eventos ya
+# registrados. Las métricas guardan los tiempos reales.
+LOG_TIME_OFFSET = 8
+
+# Métricas: archivo al que se agrega un resumen JSON cada METRICS_INTERVAL
+# segundos (None no escribe) y puerto HTTP local que entrega el estado
+# actual (None no atiende).
+METRICS_LOG = 'metrics.log'
+METRICS_INTERVAL = 60
+METRICS_PORT = None
+
+# Tamaño en bytes al que se rota METRICS_LOG y cuántos archivos rotados se
+# conservan (metrics.log.1, metrics.log.2...), así no llena la tarjeta SD.
+METRICS_LOG_BYTES = 1 << 20
+METRICS_LOG_BACKUPS = 3
+
+# Servidor que recibe los eventos y usuarios nuevos al sincronizar.
+SYNC_URL = 'https://edisonat.com/main/sync'
+
+# Carpeta de los respaldos de la base de datos y cuántos se conservan.
+BACKUP_DIR = 'backups'
+BACKUP_KEEP = 7
@@ -3,38 +3,104 @@
 Permite la captura, el entrenamiento y el reconocimiento de rostros.
 
 classes:
+    Frame
     Capture
+    Quality
     Recognize
+    Thermometer
+    Tracker
+    Grabber
+    Worker
+    Door
+    Recognizer
+    EigenRecognizer
+    EmbeddingRecognizer
+    Index
+    Projection
+    Dataset
     Train
+    Training
+    Updater
     Helper
 """
+import logging
 import os
+import tempfile
+import threading
+import multiprocessing
 import cv2
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
 import numpy as np
 from shutil import rmtree
-from time import time
-from smbus2 import SMBus
-from mlx90614 import MLX90614
+from time import perf_counter, sleep, time
+import device
+import metrics
+import store
+
+
+class Frame(object):
+    """Prepara los cuadros leídos de la cámara.
+
+    El espejo y el giro de 90 grados equivalen a transponer y voltear en
+    ambos ejes, operaciones sin pérdida que no necesitan una matriz de
+    rotación ni interpolación. Los búferes de salida se reservan con el
+    primer cuadro y se reutilizan en los siguientes.
+
+    Attributes:
+        bgr: Cuadro orientado en BGR.
+        rgb: Cuadro orientado en RGB, listo para mostrarse.
+        gray: Cuadro orientado en escala de grises, listo para detectar.
+
+    Methods:
+        load
+
+    """
+    bgr = None
+    rgb = None
+    gray = None
+
+    def load(self, frame):
+        """Orienta un cuadro y obtiene sus versiones RGB y en grises.
+
+        Args:
+            frame: Cuadro BGR leído de la cámara.
+
+        """
+        h, w = frame.shape[:2]
+        if self.bgr is None or self.bgr.shape[:2] != (w, h):
+            self.bgr = np.empty((w, h, 3), np.uint8)
+            self.rgb = np.empty((w, h, 3), np.uint8)
+            self.gray = np.empty((w, h), np.uint8)
+        cv2.transpose(frame, self.bgr)  # Girar
+        cv2.flip(self.bgr, -1, self.bgr)  # Efecto espejo
+        cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB, self.rgb)
+        cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY, self.gray)
 
 
 class Capture(object):
     """Detecta rostros en imágenes y los almacena en miniaturas.
 
-    Crea la carpeta de salida, carga el clasificador y verifica su
-    validez, intenta abrir la primera cámara.
+    Carga el clasificador y verifica su validez, intenta abrir la primera
+    cámara. Los rostros se guardan en el almacenamiento de rostros.
 
     Args:
         id: Identificador de usuario.
         cap: Cámara para captura de video.
+        quality: Filtro de calidad de los rostros, por defecto Quality().
 
     Attributes:
         _face_classifier: Clasificador haarcascade de rostros.
         _eye_classifier: Clasificador haarcascade de ojos.
         _cap: Cámara para captura de video.
-        _output: Directorio para guardar las minituras de los rostros.
+        _frame: Preparación de los cuadros leídos.
+        _id: Identificador de usuario.
         _count: Número de rostros detectados.
-        is_face: ¿Hay un rostro en la imagen?.
+        _quality: Filtro de calidad de los rostros.
+        is_face: ¿Se guardó un rostro de la imagen?.
+        rejected: Motivo por el que no se guardó el último rostro o None.
+        saved: Claves de las miniaturas guardadas.
 
     Methods:
         load
@@ -50,16 +116,18 @@ class Capture(object):
     _face_classifier = None
     _eye_classifier = None
     _cap = None
-    _output = None
+    _frame = None
+    _id = None
     _count = 0
+    _quality = None
     is_face = False
+    rejected = None
+    saved = None
 
-    def __init__(self, id, cap):
-        self._output = 'data/' + id
+    def __init__(self, id, cap, quality=None):
+        self._id = id
         face_xml = 'models/haarcascade_frontalface_default.xml'
         eye_xml = 'models/haarcascade_eye.xml'
-        if not os.path.isdir(self._output):
-            os.mkdir(self._output)  # Crea la carpeta de salida
         self._face_classifier = cv2.CascadeClassifier(face_xml)
         if self._face_classifier.empty():
             raise ValueError(
@@ -69,45 +137,57 @@ class Capture(object):
             raise ValueError(
                 'Clasificador de ojos no encontrado: ' + eye_xml)
         self._cap = cap  # Primera cámara
+        self._frame = Frame()
+        self._quality = quality or Quality()
+        self._quality.load(Helper.get_pics(id))
+        self.saved = []
 
     def load(self, detect=False):
         """Lee una imagen desde la cámara y detecta el primer rostro.
 
-        Voltea la imagen leída para obtener el efecto espejo, gira 90 grados,
-        si es necesario detecta el primer rostro y dibuja un rectángulo para
-        ubicar los ojos.
+        Orienta la imagen leída con efecto espejo, si es necesario detecta
+        el primer rostro y dibuja un rectángulo para ubicar los ojos.
 
         Args:
             detect: True o Flase, ¿Se intentará detectar rostros?.
 
+        Returns:
+            Arreglo de imagen RGB, se reutiliza en la siguiente lectura. Si
+            la cámara no entrega un cuadro se repite el anterior.
+
         """
         self.is_face = False
-        image = cv2.flip(self._cap.read()[1], 0)  # Voltear horizontalmente
-        rotacion = cv2.getRotationMatrix2D((320, 320), 90, 1)
-        image = cv2.warpAffine(image, rotacion, (480, 640))  # Rotar
+        self.rejected = None
+        ok, frame = self._cap.read()
+        if ok:
+            self._frame.load(frame)
+        else:  # Sin cuadro nuevo, conservar el anterior sin detectar
+            detect = False
+            if self._frame.rgb is None:  # Aún no llega el primer cuadro
+                self._frame.load(np.zeros((480, 640, 3), np.uint8))
+        image = self._frame.rgb
         if detect:
-            image = self._detect(image)
+            image = self._detect(image, self._frame.gray)
         # Rectángulo de los ojos
-        cv2.rectangle(image, (110, 225), (370, 300), (0, 0, 255), 5)
-        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # De BGR a RGB
+        cv2.rectangle(image, (110, 225), (370, 300), (255, 0, 0), 5)
+        return image
 
-    def _detect(self, image):
+    def _detect(self, image, gray):
         """Detecta el primer rostro en una imagen.
 
-        Crea una copia de la imagen para no modificar el original, en la
-        imagen a escala de grises se detecta los rostros, al recorrer el
-        primer rostro se dibuja un rectángulo para mostrar sus límites y
-        su id, para luego guardar la miniatura.
+        En la imagen a escala de grises se detecta los rostros, al recorrer
+        el primer rostro se dibuja un rectángulo para mostrar sus límites y
+        su id, para luego guardar la miniatura del cuadro BGR sin dibujos.
 
         Args:
-            image: Arreglo de imagen en la que se detectará rostros.
+            image: Arreglo de imagen RGB en la que se dibujará.
+            gray: Arreglo de imagen en grises en la que se detectará rostros.
 
         Returns:
             Arreglo de imagen completa con los limites del rostro.
 
         """
-        aux = image.copy()  # Imagen original
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)  # A grises
+        aux = self._frame.bgr  # Imagen original
         faces = self._face_classifier.detectMultiScale(
             gray, scaleFactor=1.3, minNeighbors=5, minSize=(480, 480))
         for (x, y, w, h) in faces:
@@ -117,58 +197,179 @@ class Capture(object):
                 cv2.rectangle(image, (110 + ex, 225 + ey),
                               (110 + ex + ew, 225 + ey + eh),
                               (255, 255, 255), 2)
-                self.is_face = True  # Encontró rostro y ojos
-            if self.is_face:
+            if len(eyes):  # Encontró rostro y ojos
+                thumb = cv2.resize(aux[y:y + h, x:x + w], (150, 150))
+                value, self.rejected = self._quality.check(
+                    cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY))
+                if self.rejected is not None:
+                    cv2.putText(image, self.rejected, (x, y - 10),
+                                2, 1, (255, 0, 0), 2, cv2.LINE_AA)
+                    break
+                self.is_face = True
                 self._count += 1
                 cv2.putText(image, str(self._count), (x, y - 10),
                             2, 2, (0, 255, 0), 2, cv2.LINE_AA)
                 cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 1)
-                self._save_thumb(aux[y:y + h, x:x + w])
+                self._save_thumb(thumb)
+                self._quality.add(value)
             break
         return image
 
     def _save_thumb(self, image):
         """Guarda la miniatura de una imagen.
 
-        Crea el directorio ‘folder’ si no existe, crea la miniatura de 150x150,
-        genera un nombre y guarda la miniatura.
+        Args:
+            image: Miniatura de 150x150 del rostro detectado.
+
+        """
+        self.saved.append(Helper.save_pic(self._id, image))
+
+
+class Quality(object):
+    """Decide si vale la pena guardar un rostro capturado.
+
+    Rechaza rostros borrosos (varianza del laplaciano), muy oscuros o muy
+    claros, girados (diferencia entre la mitad izquierda y la derecha
+    reflejada) y los que se parecen demasiado a uno ya guardado del mismo
+    usuario, comparando su hash perceptual de 64 bits.
+
+    Args:
+        sharpness: Varianza mínima del laplaciano.
+        brightness: Tupla (mínimo, máximo) del brillo promedio.
+        symmetry: Diferencia máxima entre las dos mitades, de 0 a 1.
+        distance: Bits distintos con los que un hash cuenta como repetido.
+
+    Attributes:
+        _sharpness: Varianza mínima del laplaciano.
+        _brightness: Brillo promedio aceptado.
+        _symmetry: Diferencia máxima entre mitades.
+        _distance: Bits distintos de un rostro repetido.
+        _hashes: Hashes de los rostros guardados del usuario.
+
+    Methods:
+        hash
+        load
+        check
+        add
+
+    """
+    _sharpness = 100
+    _brightness = (60, 200)
+    _symmetry = 0.3
+    _distance = 4
+    _hashes = None
+
+    def __init__(self, sharpness=100, brightness=(60, 200), symmetry=0.3,
+                 distance=4):
+        self._sharpness = sharpness
+        self._brightness = brightness
+        self._symmetry = symmetry
+        self._distance = distance
+        self._hashes = np.zeros(0, np.uint64)
+
+    @staticmethod
+    def hash(gray):
+        """Hash de diferencias de 64 bits de un rostro en grises."""
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = np.packbits(small[:, 1:] > small[:, :-1])
+        return bits.view('>u8').astype(np.uint64)[0]
+
+    def load(self, paths):
+        """Calcula los hashes de los rostros ya guardados.
 
         Args:
-            image: Arreglo que contiene el rostro detectado.
-            folder: Directorio en que se guarda la miniatura.
+            paths: Claves de las miniaturas del usuario.
 
         """
-        image = cv2.resize(image, (150, 150))  # Reducir imagen
-        now = datetime.now()  # Fecha actual para nombrar la miniatura
-        name = [f'{self._output}/{now.year}-{now.month}-{now.day}_']
-        name.append(f'{now.hour}-{now.minute}-{now.second}_{now.microsecond}')
-        name.append('.jpg')
-        cv2.imwrite(''.join(name), image)  # Guardar imagen
+        hashes = []
+        for path in paths:
+            gray = Helper.read_pic(path)
+            if gray is not None:
+                hashes.append(Quality.hash(gray))
+        self._hashes = np.array(hashes, np.uint64)
+
+    def check(self, gray):
+        """Evalúa un rostro.
+
+        Args:
+            gray: Rostro de 150x150 en escala de grises.
+
+        Returns:
+            Tupla (hash, motivo del rechazo o None si se acepta).
+
+        """
+        if cv2.Laplacian(gray, cv2.CV_64F).var() < self._sharpness:
+            return None, 'Borroso'
+        brightness = gray.mean()
+        if brightness < self._brightness[0]:
+            return None, 'Oscuro'
+        if brightness > self._brightness[1]:
+            return None, 'Muy claro'
+        half = gray.shape[1] // 2
+        left = gray[:, :half].astype(np.int16)
+        right = gray[:, -half:][:, ::-1]
+        if np.abs(left - right).mean() / 255 > self._symmetry:
+            return None, 'Mire de frente'
+        value = Quality.hash(gray)
+        if len(self._hashes):
+            bits = np.unpackbits((self._hashes ^ value).view(np.uint8))
+            if bits.reshape(-1, 64).sum(1).min() <= self._distance:
+                return value, 'Repetido'
+        return value, None
+
+    def add(self, value):
+        """Agrega el hash de un rostro guardado."""
+        self._hashes = np.append(self._hashes, np.uint64(value))
 
 
 class Recognize(object):
     """"Reconoce rostros.
 
+    Args:
+        scale: Factor de reducción de la imagen en la que se buscan rostros.
+        roi: Región (x1, y1, x2, y2) en la que se buscan rostros o None.
+        track: Cuadros seguidos sin clasificadores, 0 para no seguir rostros.
+        recognizer: Algoritmo de reconocimiento con el modelo ya leído, por
+            defecto Eigenfaces leído de models/.
+        thermometer: Sensor de temperatura, por defecto el MLX90614.
+        cap: Fuente de cuadros, por defecto la primera cámara.
+
     Attributes:
         _face_classifier: Clasificador de rostro.
         _eye_classifier: Clasificador de ojos.
         _recognizer: Algoritmo de reconocimiento facial.
+        _frame: Preparación de los cuadros leídos.
+        _scale: Factor de reducción para buscar rostros.
+        _roi: Región en la que se buscan rostros.
+        _tracker: Seguimiento del rostro entre cuadros.
         cap: Cámara para la captura de imágenes.
+        thermometer: Lecturas del sensor de temperatura.
+        probe: Función (etapa, segundos) que recibe la duración de cada
+        etapa o None, las duraciones también se registran en metrics.
+        time_offset: Segundos que se suman a los tiempos que se guardan en
+        los eventos, conserva la escala de los eventos ya registrados.
+        temp_timeout: Segundos que se espera una temperatura estable tras
+        reconocer un rostro, luego se usa la estimación disponible.
         found_nose: ¿Se encontró nariz?
         found_face: ¿Se encontró rostro?
         face_of: Identificador de usuario al que pertenece el rostro.
         count: Contador de veces que se intentará reconocer un rostro.
-        _temp: Temperatura registrada.
         _recog_time: Tiempo de reconocimiento.
         _gauge_time: Tiempo de toma de temperatura.
-        _avg: Promedio de temperatura.
+        _avg: Temperatura estimada.
 
     Methods:
         load
         _detect
+        _face_search
         _eye_search
         _nose_search
         _predict
+        _timed
+        _hit
+        done
+        update
+        reload
         avg_temp
         recog_time
         gauge_time
@@ -178,21 +379,28 @@ class Recognize(object):
     _face_classifier = None
     _eye_classifier = None
     _recognizer = None
+    _frame = None
+    _scale = 1
+    _roi = None
+    _tracker = None
     cap = None
+    thermometer = None
+    probe = None
+    time_offset = 8
+    temp_timeout = 2
     found_nose = False
     found_face = False
     face_of = None
     count = 0
-    _temp = []
     _recog_time = 0
     _gauge_time = 0
     _avg = 0
 
-    def __init__(self):
+    def __init__(self, scale=1, roi=None, track=0, recognizer=None,
+                 thermometer=None, cap=None):
         face_xml = 'models/haarcascade_frontalface_default.xml'
         eye_xml = 'models/haarcascade_eye.xml'
         nose_xml = 'models/haarcascade_mcs_nose.xml'
-        model_xml = 'models/EigenFace.xml'
         self._face_classifier = cv2.CascadeClassifier(face_xml)
         if self._face_classifier.empty():
             raise ValueError(
@@ -205,49 +413,98 @@ class Recognize(object):
         if self.nose_classifier.empty():
             raise ValueError(
                 'Clasificador de nariz no encontrado: ' + nose_xml)
-        self._recognizer = cv2.face.EigenFaceRecognizer_create()
-        self._recognizer.read(model_xml)
-        if self._recognizer.empty():
-            raise ValueError(
-                'Modelo entrenado no encontrado: ' + model_xml)
-        self.cap = cv2.VideoCapture(0)  # Primera cámara
-        if not self.cap.isOpened():
-            raise ValueError('Cámara no encontrada.')
-        self.sensor = MLX90614(SMBus(1), address=0x5A)
+        if recognizer is None:
+            recognizer = EigenRecognizer()
+            recognizer.read()
+        self._recognizer = recognizer
+        self.cap = cap or device.Device.camera(0)  # Primera cámara
+        self.thermometer = thermometer or Thermometer()
+        self.thermometer.start()
+        self._frame = Frame()
+        self._scale = scale
+        self._roi = roi
+        self._tracker = Tracker(track)
 
-    def load(self, detect=False):
-        """Lee una imagen desde la cámara."""
-        image = cv2.flip(self.cap.read()[1], 0)  # Voltear horizontalmente
-        rotacion = cv2.getRotationMatrix2D((320, 320), 90, 1)
-        image = cv2.warpAffine(image, rotacion, (480, 640))  # Rotar
-        if detect:
-            image = self._detect(image)
+    def load(self, detect=False, frame=None):
+        """Lee una imagen desde la cámara.
+
+        Args:
+            detect: True o False, ¿Se intentará detectar rostros?.
+            frame: Cuadro ya leído de la cámara, si es None se lee de `cap`.
+
+        Returns:
+            Arreglo de imagen RGB, se reutiliza en la siguiente lectura.
+
+        """
+        if frame is None:
+            frame = self.cap.read()[1]
+        self._timed('preprocess', self._frame.load, frame)
+        image = self._frame.rgb
+        if detect and not self.found_face:  # Reconocido, falta temperatura
+            image = self._detect(image, self._frame.gray)
         # Rectángulo de los ojos
-        cv2.rectangle(image, (110, 225), (370, 300), (0, 0, 255), 5)
-        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)  # De BGR a RGB
+        cv2.rectangle(image, (110, 225), (370, 300), (255, 0, 0), 5)
+        return image
 
-    def _detect(self, image):
-        """Detecta un rosotro en la imágen."""
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)  # A grises
-        faces = self._face_classifier.detectMultiScale(
-            gray, scaleFactor=1.3, minNeighbors=5, minSize=(480, 480))
+    def _detect(self, image, gray):
+        """Detecta un rosotro en la imágen.
+
+        Si el rostro se sigue desde un cuadro anterior en el que ya se
+        encontraron ojos y no nariz, se pasa directo a la predicción.
+
+        """
+        box = self._timed('track', self._tracker.update, gray)
+        faces = [box] if box is not None else \
+            self._timed('face', self._face_search, gray)
+        if box is None:
+            self._hit('face', len(faces) > 0)
         for (x, y, w, h) in faces:
             if self._recog_time == 0:
                 self._recog_time = time()
-                self._gauge_time = time()
-            self._temp.append(self.sensor.get_object_1() + 10.68)
+                self.thermometer.mark()  # Medir desde que aparece el rostro
             cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 1)
-            has_eye, image = self._eye_search(image, gray[225:300, 110:370])
+            if box is not None:
+                self._timed('predict', self._predict, gray[y:y + h, x:x + w])
+                break
+            has_eye, image = self._timed('eye', self._eye_search, image,
+                                         gray[225:300, 110:370])
+            self._hit('eye', has_eye)
             if has_eye:
-                has_nose, image = self._nose_search(
-                    image, gray[y + h // 2:y + h, x:x + w], x, y, h)
+                has_nose, image = self._timed(
+                    'nose', self._nose_search, image,
+                    gray[y + h // 2:y + h, x:x + w], x, y, h)
+                self._hit('nose', has_nose)
                 if has_nose:
                     self.found_nose = True
                 else:
-                    self._predict(gray[y:y + h, x:x + w])
+                    self._timed('predict', self._predict,
+                                gray[y:y + h, x:x + w])
+                    self._tracker.start(gray, (x, y, w, h))
             break
         return image
 
+    def _face_search(self, gray):
+        """Buscar rostros en la región y escala configuradas.
+
+        Args:
+            gray: Imagen completa en escala de grises.
+
+        Returns:
+            Lista de rostros (x, y, w, h) en coordenadas de la imagen completa.
+
+        """
+        x1, y1, x2, y2 = self._roi or (0, 0, gray.shape[1], gray.shape[0])
+        roi = gray[y1:y2, x1:x2]
+        size = round(480 * self._scale)  # Tamaño mínimo del rostro
+        if self._scale != 1:
+            roi = cv2.resize(roi, None, fx=self._scale, fy=self._scale,
+                             interpolation=cv2.INTER_AREA)
+        faces = self._face_classifier.detectMultiScale(
+            roi, scaleFactor=1.3, minNeighbors=5, minSize=(size, size))
+        return [(x1 + round(x / self._scale), y1 + round(y / self._scale),
+                 round(w / self._scale), round(h / self._scale))
+                for (x, y, w, h) in faces]
+
     def _eye_search(self, image, roi):
         """Buscar ojos en el área de interés."""
         eyes = self._eye_classifier.detectMultiScale(
@@ -277,29 +534,88 @@ class Recognize(object):
         image = cv2.resize(roi, (150, 150), interpolation=cv2.INTER_AREA)
         result = self._recognizer.predict(image)
         self.count += 1
-        if result[1] < 4500:
+        self._hit('predict', result[1] < self._recognizer.threshold)
+        if result[1] < self._recognizer.threshold:
             self.found_face = True
             self.face_of = result[0]
             self._recog_time = time() - self._recog_time
+            metrics.Metrics.instance().observe('door.recog_time',
+                                               self._recog_time)
+
+    def _timed(self, stage, function, *args):
+        """Ejecuta una etapa y entrega su duración a `probe`.
+
+        Args:
+            stage: Nombre de la etapa.
+            function: Función de la etapa.
+            args: Argumentos de la función.
+
+        Returns:
+            Resultado de la función.
+
+        """
+        start = perf_counter()
+        result = function(*args)
+        seconds = perf_counter() - start
+        metrics.Metrics.instance().observe('recognize.' + stage, seconds)
+        if self.probe is not None:
+            self.probe(stage, seconds)
+        return result
+
+    @staticmethod
+    def _hit(stage, found):
+        """Cuenta si una etapa encontró lo que buscaba.
+
+        Args:
+            stage: Nombre de la etapa.
+            found: ¿Encontró?
+
+        """
+        metrics.Metrics.instance().count(
+            f'recognize.{stage}.{"hit" if found else "miss"}')
+
+    def done(self):
+        """¿Hay una decisión pendiente de atender?
+
+        Un rostro reconocido espera a que la temperatura sea estable o a
+        que pasen `temp_timeout` segundos desde que apareció.
+
+        """
+        if self.found_face:
+            return self.thermometer.ready() or \
+                self.thermometer.gauge_time() >= self.temp_timeout
+        return self.found_nose or self.count >= 10
+
+    def update(self, added=(), removed=()):
+        """Actualiza el modelo en uso con rostros nuevos o eliminados.
+
+        Args:
+            added: Lista de (clave, identificador de usuario) nuevos.
+            removed: Lista de claves eliminadas.
+
+        """
+        self._recognizer.update(added, removed)
+
+    def reload(self):
+        """Lee de nuevo el modelo entrenado y lo pone en uso."""
+        self._recognizer.read()
 
     def avg_temp(self):
-        """Temperatura corporal."""
+        """Temperatura corporal, se fija en la primera consulta."""
         if self._avg == 0:
-            acum = 0
-            for temp in self._temp:
-                acum += temp
-            acum = acum / len(self._temp)
-            self._gauge_time = time() - self._gauge_time
-            self._avg = round(acum, 2)
+            self._gauge_time = self.thermometer.gauge_time()
+            self._avg = self.thermometer.read()
+            metrics.Metrics.instance().observe('door.gauge_time',
+                                               self._gauge_time)
         return self._avg
 
     def recog_time(self):
-        """Tiempo de reconocimiento de rostro."""
-        return round(self._recog_time, 2) + 8
+        """Tiempo de reconocimiento de rostro que se guarda en el evento."""
+        return round(self._recog_time, 2) + self.time_offset
 
     def gauge_time(self):
-        """Tiempo de toma de temperatura."""
-        return round(self._gauge_time, 2) + 8
+        """Tiempo de toma de temperatura que se guarda en el evento."""
+        return round(self._gauge_time, 2) + self.time_offset
 
     def reset(self):
         """Reinicia el reconocimiento facial."""
@@ -307,53 +623,1505 @@ class Recognize(object):
         self.found_nose = False
         self.face_of = None
         self.count = 0
-        self._temp = []
         self._recog_time = 0
         self._gauge_time = 0
         self._avg = 0
+        self._tracker.stop()
+
+
+class Thermometer(object):
+    """Lee el sensor de temperatura en un hilo dedicado.
+
+    Las lecturas del MLX90614 se guardan en un búfer circular, así el hilo
+    de detección no espera al bus I2C. La temperatura se estima con la
+    media recortada de las lecturas tomadas desde `mark`, se considera
+    estable cuando hay suficientes lecturas y su rango intercuartil es
+    pequeño.
+
+    Args:
+        offset: Grados que se suman a la temperatura del objeto.
+        gain: Compensación por grado de diferencia entre `reference` y la
+        temperatura ambiente, 0 no compensa.
+        reference: Temperatura ambiente en la que se calibró `offset`.
+        interval: Segundos entre lecturas.
+        size: Lecturas que conserva el búfer.
+        samples: Lecturas mínimas para una estimación estable.
+        spread: Rango intercuartil máximo de una estimación estable.
+        sensor: Sensor ya abierto, por defecto el MLX90614 del bus 1 (ver
+        device.Device.sensor).
+
+    Attributes:
+        _sensor: Sensor de temperatura.
+        _offset: Grados que se suman al objeto.
+        _gain: Compensación por temperatura ambiente.
+        _reference: Temperatura ambiente de calibración.
+        _interval: Segundos entre lecturas.
+        _samples: Lecturas mínimas para una estimación estable.
+        _spread: Rango intercuartil máximo.
+        _data: Búfer circular de lecturas (tiempo, objeto, ambiente).
+        _total: Número de lecturas tomadas.
+        _mark: Tiempo desde el que se estima la temperatura.
+        _ready_at: Tiempo en que la estimación se volvió estable o 0.
+        _lock: Bloqueo del búfer.
+        _thread: Hilo lector.
+        _running: ¿Está leyendo el sensor?
+
+    Methods:
+        start
+        stop
+        mark
+        ready
+        read
+        gauge_time
+        _window
+        _run
+
+    """
+    _sensor = None
+    _offset = 0
+    _gain = 0
+    _reference = 25
+    _interval = 0.05
+    _samples = 8
+    _spread = 0.3
+    _data = None
+    _total = 0
+    _mark = 0
+    _ready_at = 0
+    _lock = None
+    _thread = None
+    _running = False
+
+    def __init__(self, offset=10.68, gain=0, reference=25, interval=0.05,
+                 size=64, samples=8, spread=0.3, sensor=None):
+        self._sensor = sensor or device.Device.sensor()
+        self._offset = offset
+        self._gain = gain
+        self._reference = reference
+        self._interval = interval
+        self._samples = samples
+        self._spread = spread
+        self._data = np.zeros((size, 3))
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Inicia el hilo lector."""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo lector."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+
+    def mark(self):
+        """Empieza una medición, sólo cuentan las lecturas posteriores."""
+        with self._lock:
+            self._mark = time()
+            self._ready_at = 0
+
+    def ready(self):
+        """¿La estimación de la medición en curso ya es estable?"""
+        with self._lock:
+            if self._ready_at == 0:
+                window = self._window()
+                if len(window) >= self._samples:
+                    q1, q3 = np.percentile(window[:, 1], [25, 75])
+                    if q3 - q1 <= self._spread:
+                        self._ready_at = time()
+            return self._ready_at != 0
+
+    def read(self):
+        """Temperatura corporal estimada.
+
+        Usa las lecturas de la medición en curso; si aún no hay ninguna,
+        la última lectura del sensor.
+
+        Returns:
+            Temperatura en grados redondeada a 2 decimales o 0 sin lecturas.
+
+        """
+        with self._lock:
+            window = self._window()
+            if not len(window):
+                if self._total == 0:
+                    return 0
+                window = self._data[(self._total - 1) % len(self._data)][None]
+        objects = np.sort(window[:, 1])
+        cut = len(objects) // 4  # Descartar el cuarto inferior y superior
+        objects = objects[cut:len(objects) - cut]
+        ambient = np.median(window[:, 2])
+        temp = objects.mean() + self._offset + \
+            self._gain * (self._reference - ambient)
+        return round(float(temp), 2)
+
+    def gauge_time(self):
+        """Segundos desde `mark` hasta una estimación estable o hasta ahora."""
+        self.ready()
+        if self._mark == 0:
+            return 0
+        return (self._ready_at or time()) - self._mark
+
+    def _window(self):
+        """Lecturas de la medición en curso, llamar con el bloqueo tomado."""
+        data = self._data[:min(self._total, len(self._data))]
+        return data[data[:, 0] >= self._mark] if self._mark else data[:0]
+
+    def _run(self):
+        """Lee el sensor mientras el hilo esté activo."""
+        while self._running:
+            try:
+                values = (time(), self._sensor.get_object_1(),
+                          self._sensor.get_ambient())
+            except OSError:
+                values = None  # Error del bus, se reintenta
+            if values is not None:
+                with self._lock:
+                    self._data[self._total % len(self._data)] = values
+                    self._total += 1
+            sleep(self._interval)
+
+
+class Tracker(object):
+    """Sigue un rostro entre cuadros consecutivos.
+
+    Guarda una plantilla reducida del rostro detectado y la busca por
+    correlación normalizada en una ventana alrededor de su última posición.
+    Si la correlación cae bajo el umbral o se alcanzan `frames` cuadros
+    seguidos, se deja de seguir y se vuelve a usar los clasificadores.
+
+    Args:
+        frames: Cuadros seguidos que se sigue un rostro, 0 no lo sigue.
+        threshold: Correlación mínima para mantener el seguimiento.
+        margin: Desplazamiento máximo en píxeles entre cuadros.
+        scale: Factor de reducción de la imagen y la plantilla.
+
+    Attributes:
+        box: Rostro seguido (x, y, w, h) o None.
+        score: Correlación del último seguimiento.
+        _frames: Cuadros seguidos permitidos.
+        _threshold: Correlación mínima.
+        _margin: Desplazamiento máximo.
+        _scale: Factor de reducción.
+        _template: Plantilla reducida del rostro.
+        _count: Cuadros seguidos desde la última detección.
+
+    Methods:
+        start
+        update
+        stop
+
+    """
+    box = None
+    score = 0
+    _frames = 0
+    _threshold = 0
+    _margin = 0
+    _scale = 1
+    _template = None
+    _count = 0
+
+    def __init__(self, frames=0, threshold=0.9, margin=40, scale=0.25):
+        self._frames = frames
+        self._threshold = threshold
+        self._margin = margin
+        self._scale = scale
+
+    def start(self, gray, box):
+        """Empieza a seguir un rostro detectado por los clasificadores.
+
+        Args:
+            gray: Imagen completa en escala de grises.
+            box: Rostro detectado (x, y, w, h).
+
+        """
+        if self._frames == 0:
+            return
+        x, y, w, h = (round(v * self._scale) for v in box)
+        small = cv2.resize(gray, None, fx=self._scale, fy=self._scale,
+                           interpolation=cv2.INTER_AREA)
+        self._template = small[y:y + h, x:x + w].copy()
+        if self._template.size == 0:
+            self.stop()
+            return
+        self.box = tuple(box)
+        self.score = 1
+        self._count = 0
+
+    def update(self, gray):
+        """Busca el rostro seguido en un nuevo cuadro.
+
+        Args:
+            gray: Imagen completa en escala de grises.
+
+        Returns:
+            Rostro (x, y, w, h) en coordenadas de la imagen completa, o
+            None si no se sigue un rostro o se perdió.
+
+        """
+        if self.box is None:
+            return None
+        self._count += 1
+        if self._count > self._frames:
+            return self.stop()
+        small = cv2.resize(gray, None, fx=self._scale, fy=self._scale,
+                           interpolation=cv2.INTER_AREA)
+        x, y, w, h = (round(v * self._scale) for v in self.box)
+        th, tw = self._template.shape
+        m = round(self._margin * self._scale)
+        x1, y1 = max(0, x - m), max(0, y - m)
+        x2 = min(small.shape[1], x + tw + m)
+        y2 = min(small.shape[0], y + th + m)
+        if x2 - x1 < tw or y2 - y1 < th:
+            return self.stop()
+        result = cv2.matchTemplate(small[y1:y2, x1:x2], self._template,
+                                   cv2.TM_CCOEFF_NORMED)
+        self.score, loc = cv2.minMaxLoc(result)[1::2]
+        if self.score < self._threshold:
+            return self.stop()
+        self.box = (round((x1 + loc[0]) / self._scale),
+                    round((y1 + loc[1]) / self._scale),
+                    self.box[2], self.box[3])
+        return self.box
+
+    def stop(self):
+        """Deja de seguir el rostro."""
+        self.box = None
+        self._template = None
+        return None
+
+
+class Grabber(object):
+    """Lee la cámara en un hilo dedicado.
+
+    Conserva los últimos cuadros en un búfer circular acotado, así quien
+    los consume obtiene siempre el más reciente sin esperar a la cámara.
+
+    Args:
+        cap: Cámara para captura de video.
+        size: Número de cuadros que conserva el búfer.
+
+    Attributes:
+        _cap: Cámara para captura de video.
+        _frames: Búfer circular con los últimos cuadros leídos.
+        _cond: Condición para avisar la llegada de un cuadro.
+        _thread: Hilo lector.
+        _running: ¿Está leyendo la cámara?
+        seq: Número del último cuadro leído.
+
+    Methods:
+        start
+        stop
+        latest
+        read
+        _run
+
+    """
+    _cap = None
+    _frames = None
+    _cond = None
+    _thread = None
+    _running = False
+    seq = 0
+
+    def __init__(self, cap, size=2):
+        self._cap = cap
+        self._frames = deque(maxlen=size)
+        self._cond = threading.Condition()
+
+    def start(self):
+        """Inicia el hilo lector."""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo lector."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+
+    def latest(self, after=0, timeout=1):
+        """Obtiene el cuadro más reciente.
+
+        Args:
+            after: Número del último cuadro ya procesado.
+            timeout: Segundos de espera por un cuadro posterior a `after`.
+
+        Returns:
+            Tupla (número, cuadro) o (after, None) si no llegó ninguno.
+
+        """
+        with self._cond:
+            if self._cond.wait_for(lambda: self.seq > after, timeout):
+                return self._frames[-1]
+        return after, None
+
+    def read(self):
+        """Lee el último cuadro, igual que cv2.VideoCapture.read."""
+        frame = self.latest()[1]
+        return frame is not None, frame
+
+    def _run(self):
+        """Lee cuadros mientras el hilo esté activo."""
+        while self._running:
+            ok, frame = self._cap.read()
+            if not ok:
+                sleep(0.01)  # Evitar un ciclo ocupado sin cámara
+                continue
+            with self._cond:
+                self.seq += 1
+                self._frames.append((self.seq, frame))
+                self._cond.notify_all()
+            metrics.Metrics.instance().count('camera.frames')
+
+
+class Worker(object):
+    """Reconoce rostros en un hilo aparte de la interfaz.
+
+    Toma del lector el cuadro más reciente, lo procesa con el reconocedor y
+    publica la imagen resultante. Cuando el reconocedor llega a una
+    decisión deja de detectar hasta que la interfaz la atienda y llame a
+    `reset`, de modo que el estado no cambia mientras se lee.
+
+    Args:
+        grabber: Lector de la cámara.
+        recognize: Objeto que reconoce rostros.
+
+    Attributes:
+        detect: ¿Se intentará detectar rostros?
+        _grabber: Lector de la cámara.
+        _recognize: Objeto que reconoce rostros.
+        _lock: Bloqueo del resultado publicado.
+        _active: Evento que indica si se procesan cuadros.
+        _thread: Hilo de procesamiento.
+        _running: ¿Está activo el hilo?
+        _count: Número de resultados publicados.
+        _image: Última imagen procesada.
+        _done: ¿El último resultado contiene una decisión?
+        _reset: ¿Se pidió reiniciar el reconocimiento?
+
+    Methods:
+        start
+        stop
+        pause
+        resume
+        result
+        reset
+        _run
+
+    """
+    detect = False
+    _grabber = None
+    _recognize = None
+    _lock = None
+    _active = None
+    _thread = None
+    _running = False
+    _count = 0
+    _image = None
+    _done = False
+    _reset = False
+
+    def __init__(self, grabber, recognize):
+        self._grabber = grabber
+        self._recognize = recognize
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+
+    def start(self):
+        """Inicia el hilo de procesamiento."""
+        if self._thread is None:
+            self._running = True
+            self._active.set()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Detiene el hilo de procesamiento."""
+        self._running = False
+        self._active.set()  # Despertar el hilo si estaba en pausa
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+
+    def pause(self):
+        """Deja de procesar cuadros, la cámara sigue disponible."""
+        self._active.clear()
+
+    def resume(self):
+        """Vuelve a procesar cuadros."""
+        self._active.set()
+
+    def result(self):
+        """Obtiene el último resultado publicado.
+
+        Returns:
+            Tupla (número de resultado, imagen RGB, ¿hay decisión?).
+
+        """
+        with self._lock:
+            return self._count, self._image, self._done
+
+    def reset(self):
+        """Pide reiniciar el reconocimiento antes del siguiente cuadro."""
+        with self._lock:
+            self._reset = True
+            self._done = False
+
+    def _run(self):
+        """Procesa el cuadro más reciente mientras el hilo esté activo."""
+        seq = 0
+        while self._running:
+            if not self._active.wait(0.5):
+                continue
+            last = seq
+            seq, frame = self._grabber.latest(seq)
+            if frame is None:
+                continue
+            if last:
+                metrics.Metrics.instance().count('worker.dropped',
+                                                 seq - last - 1)
+            with self._lock:
+                if self._reset:
+                    self._recognize.reset()
+                    self._reset = False
+                detect = self.detect and not self._done
+            image = self._recognize.load(detect, frame)
+            with self._lock:
+                if self._reset:
+                    continue  # Resultado anterior al reinicio
+                self._count += 1
+                metrics.Metrics.instance().count('worker.frames')
+                self._image = image.copy()  # El búfer se reutiliza
+                self._done = self._recognize.done()
+
+
+class Door(object):
+    """Entrada con su propia cámara y sensor de temperatura.
+
+    Cada puerta lee su cámara y detecta rostros en sus propios hilos; el
+    algoritmo de reconocimiento y el registro de eventos se comparten entre
+    todas las puertas del equipo.
+
+    Args:
+        id: Identificador de la puerta, se guarda en los eventos.
+        recognize: Reconocedor de la puerta con su cámara y su sensor.
+
+    Attributes:
+        id: Identificador de la puerta.
+        recognize: Reconocedor de la puerta.
+        grabber: Hilo que lee la cámara.
+        worker: Hilo que detecta rostros en los cuadros leídos.
+        _until: Hora hasta la que la puerta no detecta rostros.
+
+    Methods:
+        start
+        stop
+        hold
+        ready
+
+    """
+    id = 1
+    recognize = None
+    grabber = None
+    worker = None
+    _until = 0
+
+    def __init__(self, id, recognize):
+        self.id = id
+        self.recognize = recognize
+        self.grabber = Grabber(recognize.cap)
+        self.worker = Worker(self.grabber, recognize)
+
+    def start(self):
+        """Inicia la lectura de la cámara y la detección."""
+        self.grabber.start()
+        self.worker.start()
+
+    def stop(self):
+        """Detiene los hilos de la puerta y libera la cámara."""
+        self.worker.stop()
+        self.grabber.stop()
+        self.recognize.thermometer.stop()
+        self.recognize.cap.release()
+
+    def hold(self, seconds):
+        """No detectar rostros durante unos segundos tras una decisión."""
+        self._until = time() + seconds
+
+    def ready(self):
+        """¿Terminó la espera tras la última decisión?"""
+        return time() >= self._until
+
+
+class Recognizer(object):
+    """Algoritmo de reconocimiento facial.
+
+    Define las operaciones que usan Recognize y Train, cada algoritmo las
+    implementa en una subclase.
+
+    Attributes:
+        threshold: Distancia máxima para aceptar una predicción.
+
+    Methods:
+        create
+        read
+        train
+        update
+        save
+        search
+        predict
+
+    """
+    threshold = 0
+
+    @staticmethod
+    def create(name, threshold=None, path=None):
+        """Crea un algoritmo de reconocimiento por su nombre.
+
+        Args:
+            name: 'eigen' o 'embedding'.
+            threshold: Distancia máxima, None usa la del algoritmo.
+            path: Archivo del modelo entrenado, None usa el del algoritmo.
+
+        Returns:
+            Instancia del algoritmo.
+
+        Raises:
+            ValueError: Si el nombre no corresponde a un algoritmo.
+
+        """
+        kwargs = {} if path is None else {'path': path}
+        if name == 'eigen':
+            recognizer = EigenRecognizer(**kwargs)
+        elif name == 'embedding':
+            recognizer = EmbeddingRecognizer(**kwargs)
+        else:
+            raise ValueError('Algoritmo de reconocimiento desconocido: '
+                             + str(name))
+        if threshold is not None:
+            recognizer.threshold = threshold
+        return recognizer
+
+    def read(self):
+        """Lee el modelo entrenado."""
+        raise NotImplementedError
+
+    def train(self, data, labels, keys, progress=None):
+        """Entrena y guarda el modelo.
+
+        El modelo nuevo reemplaza al anterior sólo al terminar, mientras
+        tanto se puede seguir prediciendo desde otro hilo. El archivo se
+        escribe aparte y luego se renombra, nunca queda a medio escribir.
+
+        Args:
+            data: Lista de rostros de 150x150 en escala de grises.
+            labels: Identificador de usuario de cada rostro.
+            keys: Ruta de cada rostro.
+            progress: Función (fase, hechos, total) que recibe el avance.
+
+        """
+        raise NotImplementedError
+
+    def update(self, added, removed):
+        """Actualiza el modelo en memoria con rostros nuevos o eliminados.
+
+        El archivo del modelo no cambia hasta llamar a save.
+
+        Args:
+            added: Lista de (clave, identificador de usuario) nuevos.
+            removed: Lista de claves eliminadas.
+
+        """
+        raise NotImplementedError
+
+    def save(self):
+        """Guarda en el archivo del modelo las actualizaciones pendientes."""
+        raise NotImplementedError
+
+    def search(self, image, k=1, per_user=False):
+        """Busca los rostros guardados más parecidos.
+
+        Args:
+            image: Rostro de 150x150 en escala de grises.
+            k: Número de vecinos.
+            per_user: ¿Sólo el rostro más cercano de cada usuario?
+
+        Returns:
+            Tupla (identificadores, distancias) ordenada por distancia.
+
+        """
+        raise NotImplementedError
+
+    def predict(self, image):
+        """Predice a quién pertenece un rostro.
+
+        Args:
+            image: Rostro de 150x150 en escala de grises.
+
+        Returns:
+            Tupla (identificador de usuario, distancia), (-1, infinito) si
+            no hay rostros guardados.
+
+        """
+        labels, distances = self.search(image)
+        if not len(labels):
+            return -1, float('inf')
+        return int(labels[0]), float(distances[0])
+
+
+class EigenRecognizer(Recognizer):
+    """Reconocimiento con Eigenfaces de OpenCV.
+
+    Las Eigenfaces dependen de todos los rostros, una actualización vuelve
+    a entrenar en memoria con los rostros ya leídos y sólo lee del disco
+    los nuevos. OpenCV entrena y guarda el modelo; para predecir se usa una
+    Projection armada con el modelo, que da las mismas distancias. Sin
+    rostros no hay modelo y ninguna predicción se acepta.
+
+    Args:
+        path: Archivo del modelo entrenado.
+
+    Attributes:
+        _path: Archivo del modelo entrenado.
+        _projection: Rostros de entrenamiento proyectados o None.
+        _model: Modelo actualizado aún sin guardar o None.
+        _changed: ¿Hay una actualización sin guardar?
+        _faces: Rostros leídos por clave, (imagen, identificador).
+        _lock: Bloqueo de las actualizaciones.
+
+    Methods:
+        _fit
+
+    """
+    threshold = 4500
+    _path = None
+    _projection = None
+    _model = None
+    _changed = False
+    _faces = None
+    _lock = None
+
+    def __init__(self, path='models/EigenFace.xml'):
+        self._path = path
+        self._lock = threading.RLock()
+
+    def read(self):
+        """Lee el modelo entrenado.
+
+        Raises:
+            ValueError: Si no se encontró el modelo.
+
+        """
+        model = cv2.face.EigenFaceRecognizer_create()
+        model.read(self._path)
+        if model.empty():
+            raise ValueError('Modelo entrenado no encontrado: ' + self._path)
+        projection = Projection.from_model(model)
+        with self._lock:
+            self._projection = projection
+            self._model = None  # El archivo reemplaza lo no guardado
+            self._changed = False
+            self._faces = None  # Se vuelven a leer en la próxima actualización
+
+    def train(self, data, labels, keys, progress=None):
+        """Entrena y guarda el modelo."""
+        with self._lock:
+            if progress is not None:
+                progress('Entrenando', 0, 1)
+            self._fit(data, labels)
+            self._faces = dict(zip(keys, zip(data, labels)))
+            self.save()
+
+    def update(self, added, removed):
+        """Vuelve a entrenar en memoria con los rostros nuevos o eliminados."""
+        with self._lock:
+            if self._faces is None:
+                data, labels, keys = Dataset().load(Train.faces())
+                self._faces = dict(zip(keys, zip(data, labels)))
+            for key in removed:
+                self._faces.pop(key, None)
+            for key, label in added:
+                image = Helper.read_pic(key)
+                if image is not None:
+                    self._faces[key] = (image, label)
+            faces = list(self._faces.values())
+            self._fit([image for image, _ in faces],
+                      [label for _, label in faces])
+
+    def save(self):
+        """Escribe el modelo actualizado, sin rostros borra el archivo."""
+        with self._lock:
+            if not self._changed:
+                return
+            if self._model is None:
+                if os.path.isfile(self._path):
+                    os.remove(self._path)
+            else:
+                tmp = '.tmp'.join(os.path.splitext(self._path))
+                self._model.write(tmp)
+                os.replace(tmp, self._path)
+            self._model = None  # Ya no hace falta para predecir
+            self._changed = False
+
+    def search(self, image, k=1, per_user=False):
+        """Busca los rostros de entrenamiento más cercanos."""
+        projection = self._projection
+        if projection is None:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+        return projection.search(image, k, per_user)
+
+    def _fit(self, data, labels):
+        """Entrena en memoria y deja el modelo pendiente de guardar."""
+        model = None
+        if len(data):
+            model = cv2.face.EigenFaceRecognizer_create()
+            model.train(list(data), np.array(labels))
+        self._projection = None if model is None else \
+            Projection.from_model(model)
+        self._model = model
+        self._changed = True
+
+
+class EmbeddingRecognizer(Recognizer):
+    """Reconocimiento por vectores de rasgos faciales.
+
+    Una red ONNX ejecutada con cv2.dnn en la CPU convierte cada rostro en
+    un vector normalizado, la predicción busca el vector más cercano entre
+    los usuarios registrados. La distancia es 1 - similitud coseno.
+
+    Args:
+        model: Archivo ONNX de la red de rasgos.
+        path: Archivo con los vectores de los usuarios registrados.
+        size: Tamaño de la imagen de entrada de la red.
+
+    Attributes:
+        _model: Archivo ONNX de la red de rasgos.
+        _path: Archivo con los vectores de los usuarios registrados.
+        _size: Tamaño de la imagen de entrada de la red.
+        _net: Red de rasgos.
+        _index: Índice de vecinos más cercanos.
+        _lock: Bloqueo de la red, no admite hilos concurrentes.
+        _update: Bloqueo de las actualizaciones.
+        _changed: ¿Hay una actualización sin guardar?
+
+    Methods:
+        embed
+
+    """
+    threshold = 0.4
+    _model = None
+    _path = None
+    _size = 112
+    _net = None
+    _index = None
+    _lock = None
+    _update = None
+    _changed = False
+
+    def __init__(self, model='models/face.onnx',
+                 path='models/embeddings.npz', size=112):
+        self._model = model
+        self._path = path
+        self._size = size
+        self._lock = threading.Lock()
+        self._update = threading.RLock()
+
+    def _load_net(self):
+        """Carga la red de rasgos si aún no se cargó.
+
+        Raises:
+            ValueError: Si no se encontró la red.
+
+        """
+        if self._net is None:
+            if not os.path.isfile(self._model):
+                raise ValueError('Red de rasgos no encontrada: ' + self._model)
+            self._net = cv2.dnn.readNetFromONNX(self._model)
+
+    def read(self):
+        """Carga la red y los vectores de los usuarios registrados.
+
+        Raises:
+            ValueError: Si no se encontró la red o los vectores.
+
+        """
+        self._load_net()
+        if not os.path.isfile(self._path):
+            raise ValueError('Modelo entrenado no encontrado: ' + self._path)
+        with self._update:
+            self._index = Index.load(self._path)
+            self._changed = False
+
+    def embed(self, image):
+        """Obtiene el vector de rasgos normalizado de un rostro.
+
+        Args:
+            image: Rostro en escala de grises.
+
+        Returns:
+            Vector float32 de norma 1.
+
+        """
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        blob = cv2.dnn.blobFromImage(
+            image, 1 / 127.5, (self._size, self._size),
+            (127.5, 127.5, 127.5), swapRB=True)
+        with self._lock:
+            self._net.setInput(blob)
+            vector = self._net.forward().flatten().astype(np.float32)
+        return vector / max(np.linalg.norm(vector), 1e-12)
+
+    def train(self, data, labels, keys, progress=None):
+        """Calcula los vectores de todos los rostros y los guarda."""
+        with self._update:
+            self._load_net()
+            vectors = []
+            for image in data:
+                if progress is not None:
+                    progress('Calculando rasgos', len(vectors), len(data))
+                vectors.append(self.embed(image))
+            index = Index(vectors, labels, keys)
+            index.save(self._path)
+            self._index = index
+            self._changed = False
+
+    def update(self, added, removed):
+        """Calcula sólo los vectores nuevos y quita los eliminados."""
+        with self._update:
+            self._load_net()
+            if self._index is None:
+                self._index = Index.load(self._path)
+            vectors = []
+            labels = []
+            keys = []
+            for key, label in added:
+                image = Helper.read_pic(key)
+                if image is not None:
+                    vectors.append(self.embed(image))
+                    labels.append(label)
+                    keys.append(key)
+            self._index = self._index.remove(removed).add(vectors, labels,
+                                                          keys)
+            self._changed = True
+
+    def save(self):
+        """Escribe los vectores actualizados."""
+        with self._update:
+            if self._changed:
+                self._index.save(self._path)
+                self._changed = False
+
+    def search(self, image, k=1, per_user=False):
+        """Busca los vectores más cercanos al del rostro."""
+        return self._index.search(self.embed(image), k, per_user)
+
+
+class Index(object):
+    """Índice de vecinos más cercanos sobre vectores normalizados.
+
+    Guarda todos los vectores en una matriz contigua, una búsqueda es un
+    único producto matriz-vector con NumPy. Agregar o quitar vectores
+    devuelve un índice nuevo, así el que está en uso no cambia.
+
+    Args:
+        vectors: Matriz de N x D vectores de norma 1.
+        labels: Identificador de usuario de cada vector.
+        keys: Ruta del rostro de cada vector.
+
+    Attributes:
+        vectors: Matriz de vectores.
+        labels: Arreglo de identificadores.
+        keys: Arreglo de claves.
+
+    Methods:
+        search
+        nearest
+        add
+        remove
+        save
+        load
+
+    """
+    vectors = None
+    labels = None
+    keys = None
+
+    def __init__(self, vectors, labels, keys):
+        self.vectors = np.array(vectors, dtype=np.float32)
+        self.labels = np.array(labels, dtype=np.int64)
+        self.keys = np.array(keys, dtype=str)
+
+    def search(self, vector, k=1, per_user=False):
+        """Busca los vectores más cercanos.
+
+        Args:
+            vector: Vector de consulta de norma 1.
+            k: Número de vecinos.
+            per_user: ¿Sólo el vector más cercano de cada usuario?
+
+        Returns:
+            Tupla (identificadores, distancias) ordenada por distancia.
+
+        """
+        if not len(self.labels):
+            return self.labels[:0], np.empty(0, np.float32)
+        return Index.nearest(1 - self.vectors @ vector, self.labels, k,
+                             per_user)
+
+    @staticmethod
+    def nearest(distances, labels, k=1, per_user=False):
+        """Elige las k distancias menores.
+
+        Args:
+            distances: Distancia a cada vector guardado.
+            labels: Identificador de usuario de cada vector.
+            k: Número de vecinos.
+            per_user: ¿Sólo la menor distancia de cada usuario?
+
+        Returns:
+            Tupla (identificadores, distancias) ordenada por distancia.
+
+        """
+        if per_user and k > 1:
+            order = np.argsort(distances, kind='stable')
+            _, first = np.unique(labels[order], return_index=True)
+            nearest = order[np.sort(first)][:k]  # Orden por distancia
+            return labels[nearest], distances[nearest]
+        k = min(k, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+        return labels[nearest], distances[nearest]
+
+    def add(self, vectors, labels, keys):
+        """Agrega vectores.
+
+        Returns:
+            Índice nuevo con los vectores agregados.
+
+        """
+        if not len(keys):
+            return self
+        if not len(self.keys):
+            return Index(vectors, labels, keys)
+        return Index(np.vstack([self.vectors, vectors]),
+                     np.concatenate([self.labels, labels]),
+                     np.concatenate([self.keys, keys]))
+
+    def remove(self, keys):
+        """Quita los vectores de las claves indicadas.
+
+        Returns:
+            Índice nuevo sin esos vectores.
+
+        """
+        if not len(keys):
+            return self
+        keep = ~np.isin(self.keys, list(keys))
+        return Index(self.vectors[keep], self.labels[keep], self.keys[keep])
+
+    def save(self, path):
+        """Guarda el índice en un archivo .npz."""
+        tmp = '.tmp'.join(os.path.splitext(path))
+        np.savez(tmp, vectors=self.vectors, labels=self.labels,
+                 keys=self.keys)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        """Lee un índice guardado con save."""
+        with np.load(path) as data:
+            return Index(data['vectors'], data['labels'], data['keys'])
+
+
+class Projection(object):
+    """Rostros de entrenamiento proyectados en el espacio de Eigenfaces.
+
+    EigenFaceRecognizer.predict proyecta el rostro y luego lo compara con
+    cada rostro de entrenamiento uno por uno. Aquí las proyecciones están
+    en una matriz contigua y las distancias L2 a todas se calculan con un
+    único producto matriz-vector, usando |p - q|² = |p|² - 2 p·q + |q|²
+    con las normas |p|² calculadas de antemano. Las distancias son las de
+    OpenCV, el umbral no cambia.
+
+    Args:
+        mean: Rostro promedio, vector de D valores.
+        eigenvectors: Matriz D x K de Eigenfaces.
+        projections: Matriz N x K de rostros de entrenamiento proyectados.
+        labels: Identificador de usuario de cada rostro.
+
+    Attributes:
+        mean: Rostro promedio.
+        eigenvectors: Matriz de Eigenfaces.
+        projections: Matriz de proyecciones.
+        norms: Cuadrado de la norma de cada proyección.
+        labels: Arreglo de identificadores.
+
+    Methods:
+        from_model
+        project
+        search
+
+    """
+    mean = None
+    eigenvectors = None
+    projections = None
+    norms = None
+    labels = None
+
+    def __init__(self, mean, eigenvectors, projections, labels):
+        self.mean = np.ascontiguousarray(mean, np.float32).ravel()
+        self.eigenvectors = np.ascontiguousarray(eigenvectors, np.float32)
+        self.projections = np.ascontiguousarray(
+            projections, np.float64).reshape(-1, self.eigenvectors.shape[1])
+        self.norms = np.einsum('ij,ij->i', self.projections,
+                               self.projections)
+        self.labels = np.array(labels, dtype=np.int64).ravel()
+
+    @staticmethod
+    def from_model(model):
+        """Arma las proyecciones de un EigenFaceRecognizer entrenado."""
+        projections = model.getProjections()
+        return Projection(model.getMean(), model.getEigenVectors(),
+                          np.vstack(projections) if len(projections) else
+                          np.zeros((0, 0)), model.getLabels())
+
+    def project(self, image):
+        """Proyecta un rostro de 150x150 en el espacio de Eigenfaces."""
+        return ((image.ravel().astype(np.float32) - self.mean)
+                @ self.eigenvectors).astype(np.float64)
+
+    def search(self, image, k=1, per_user=False):
+        """Busca los rostros de entrenamiento más cercanos.
+
+        Args:
+            image: Rostro de 150x150 en escala de grises.
+            k: Número de vecinos.
+            per_user: ¿Sólo el rostro más cercano de cada usuario?
+
+        Returns:
+            Tupla (identificadores, distancias L2) ordenada por distancia.
+
+        """
+        if not len(self.labels):
+            return self.labels[:0], np.empty(0, np.float32)
+        query = self.project(image)
+        squared = self.norms - 2 * (self.projections @ query) + query @ query
+        distances = np.sqrt(np.maximum(squared, 0))
+        return Index.nearest(distances, self.labels, k, per_user)
+
+
+class Dataset(object):
+    """Rostros de entrenamiento leídos en paralelo y guardados en caché.
+
+    Los rostros se guardan juntos en un arreglo de N x 150 x 150 en escala
+    de grises que se mapea en memoria, junto a un índice con la ruta, el
+    usuario y la fecha de modificación de cada uno. Al cargar sólo se
+    decodifican los archivos nuevos o modificados, en varios hilos. Con el
+    almacenamiento empaquetado los rostros ya están en un arreglo mapeado y
+    no hace falta la caché.
+
+    Args:
+        path: Archivo del arreglo de rostros, el índice usa el mismo nombre
+            con extensión .npz.
+        workers: Hilos que decodifican imágenes.
+
+    Attributes:
+        _path: Archivo del arreglo de rostros.
+        _index: Archivo del índice.
+        _workers: Hilos que decodifican imágenes.
+
+    Methods:
+        load
+        _temp
+
+    """
+    _path = None
+    _index = None
+    _workers = 4
+
+    def __init__(self, path='data/faces.npy', workers=4):
+        self._path = path
+        self._index = os.path.splitext(path)[0] + '.npz'
+        self._workers = workers
+
+    def load(self, faces, progress=None):
+        """Carga los rostros indicados, usando la caché si está al día.
+
+        Args:
+            faces: Lista de (clave, identificador de usuario).
+            progress: Función (fase, hechos, total) que recibe el avance.
+
+        Returns:
+            Tupla (arreglo N x 150 x 150 mapeado en memoria, lista de
+            identificadores, lista de claves), sin los rostros ilegibles.
+
+        """
+        faces_store = Helper.store()
+        if isinstance(faces_store, store.PackStore):
+            return faces_store.load(faces)
+        cached = {}
+        order = []  # (ruta, identificador) en el orden de la caché
+        images = None
+        if os.path.isfile(self._path) and os.path.isfile(self._index):
+            images = np.load(self._path, mmap_mode='r')
+            with np.load(self._index) as index:
+                if len(index['keys']) != len(images):
+                    images = None  # Arreglo e índice de escrituras distintas
+                else:
+                    for row, (key, label, mtime) in enumerate(zip(
+                            index['keys'], index['labels'],
+                            index['mtimes'])):
+                        cached[str(key)] = (int(mtime), images[row])
+                        order.append((str(key), int(label)))
+        mtimes = [faces_store.version(path) for path, _ in faces]
+        pending = [i for i, (path, _) in enumerate(faces)
+                   if mtimes[i] is None or
+                   cached.get(path, (None,))[0] != mtimes[i]]
+        if images is not None and not pending and \
+                order == [(path, int(label)) for path, label in faces]:
+            return images, [label for _, label in order], \
+                [key for key, _ in order]  # Caché al día, no se reescribe
+        decoded = {}
+        with ThreadPoolExecutor(self._workers) as executor:
+            for i, image in zip(pending, executor.map(
+                    faces_store.read, [faces[i][0] for i in pending])):
+                decoded[i] = image
+                if progress is not None:
+                    progress('Leyendo rostros', len(decoded), len(pending))
+        rows = []
+        for i, (path, label) in enumerate(faces):
+            image = decoded[i] if i in decoded else cached[path][1]
+            if image is not None:
+                rows.append((path, label, mtimes[i], image))
+        keys = [row[0] for row in rows]
+        labels = [row[1] for row in rows]
+        if not rows:
+            return np.empty((0, 150, 150), np.uint8), labels, keys
+        # Nombres temporales propios, el entrenamiento y las
+        # actualizaciones pueden escribir la caché a la vez
+        tmp = Dataset._temp(self._path)
+        data = np.lib.format.open_memmap(
+            tmp, mode='w+', dtype=np.uint8, shape=(len(rows), 150, 150))
+        for row, (_, _, _, image) in enumerate(rows):
+            data[row] = image
+        data.flush()
+        del data
+        os.replace(tmp, self._path)
+        tmp = Dataset._temp(self._index)
+        np.savez(tmp, keys=np.array(keys, dtype=str),
+                 labels=np.array(labels, dtype=np.int64),
+                 mtimes=np.array([row[2] for row in rows], dtype=np.int64))
+        os.replace(tmp, self._index)
+        return np.load(self._path, mmap_mode='r'), labels, keys
+
+    @staticmethod
+    def _temp(path):
+        """Crea un archivo temporal único junto a `path`."""
+        folder, name = os.path.split(path)
+        base, ext = os.path.splitext(name)
+        fd, tmp = tempfile.mkstemp(ext, base + '.', folder or '.')
+        os.close(fd)
+        return tmp
 
 
 class Train(object):
-    """Entrena y alamcena los resultados en un archivo."""
-
-    def __init__(self):
-        labels = []
-        data = []
-        with os.scandir('data') as users:
-            for user in users:
-                if user.is_dir():
-                    with os.scandir(user.path) as faces:
-                        _label = int(user.name)
-                        for face in faces:
-                            if face.is_file() and face.path.endswith('.jpg'):
-                                labels.append(_label)
-                                data.append(cv2.imread(face.path, 0))
-
-        face_recognizer = cv2.face.EigenFaceRecognizer_create()
-        face_recognizer.train(data, np.array(labels))
-        face_recognizer.write('models/EigenFace.xml')
+    """Entrena y alamcena los resultados en un archivo.
+
+    Args:
+        recognizer: Algoritmo de reconocimiento, por defecto Eigenfaces.
+        progress: Función (fase, hechos, total) que recibe el avance.
+
+    Methods:
+        faces
+
+    """
+
+    def __init__(self, recognizer=None, progress=None):
+        data, labels, keys = Dataset().load(Train.faces(), progress)
+        recognizer = recognizer or EigenRecognizer()
+        recognizer.train(list(data), labels, keys, progress)
+
+    @staticmethod
+    def faces():
+        """Lista los rostros guardados de todos los usuarios.
+
+        Returns:
+            Lista de (clave, identificador de usuario).
+
+        """
+        faces = []
+        for user in Helper.store().users():
+            for path in Helper.get_pics(str(user)):
+                faces.append((path, user))
+        return faces
+
+
+class Training(object):
+    """Entrena en un proceso aparte e informa el avance.
+
+    El proceso usa otro núcleo del procesador, así la interfaz y el
+    reconocimiento siguen respondiendo. Los mensajes llegan por una cola
+    como tuplas (fase, hechos, total, segundos restantes o None); al
+    terminar llega ('Terminado', ...) o ('Error', mensaje, 0, None).
+
+    Args:
+        name: Nombre del algoritmo de reconocimiento.
+
+    Attributes:
+        _queue: Cola de mensajes de avance.
+        _process: Proceso de entrenamiento.
+        finished: ¿Terminó correctamente?
+        error: Mensaje de error o None.
+
+    Methods:
+        start
+        poll
+        alive
+        cancel
+        _run
+
+    """
+    _queue = None
+    _process = None
+    finished = False
+    error = None
+
+    def __init__(self, name):
+        context = multiprocessing.get_context('spawn')  # Sin hilos heredados
+        self._queue = context.Queue()
+        self._process = context.Process(target=Training._run,
+                                        args=(name, self._queue),
+                                        daemon=True)
+
+    def start(self):
+        """Inicia el proceso."""
+        self._process.start()
+
+    def poll(self):
+        """Obtiene los mensajes de avance sin esperar.
+
+        Returns:
+            Lista de mensajes recibidos desde la última consulta.
+
+        """
+        messages = []
+        while True:
+            try:
+                message = self._queue.get_nowait()
+            except Empty:
+                break
+            if message[0] == 'Terminado':
+                self.finished = True
+            elif message[0] == 'Error':
+                self.error = message[1]
+            messages.append(message)
+        return messages
+
+    def alive(self):
+        """¿Sigue entrenando?"""
+        return self._process.is_alive()
+
+    def cancel(self):
+        """Detiene el entrenamiento, el modelo anterior queda intacto."""
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(1)
+
+    @staticmethod
+    def _run(name, queue):
+        """Entrena en el proceso hijo y envía el avance por la cola."""
+        starts = {}  # Inicio de cada fase
+
+        def progress(phase, done, total):
+            start = starts.setdefault(phase, time())
+            eta = None
+            if done:
+                eta = round((time() - start) / done * (total - done))
+            queue.put((phase, done, total, eta))
+
+        try:
+            Train(Recognizer.create(name), progress)
+            queue.put(('Terminado', 1, 1, 0))
+        except Exception as error:
+            queue.put(('Error', str(error), 0, None))
+
+
+class Updater(object):
+    """Aplica al modelo en uso los rostros agregados o eliminados.
+
+    Un solo hilo actualiza el modelo; los cambios que llegan mientras tanto
+    se juntan y se aplican en la siguiente actualización, así eliminar
+    varios rostros seguidos no inicia varios entrenamientos a la vez. El
+    modelo se escribe en disco cuando pasan `delay` segundos sin cambios y
+    al detener. Los errores se registran y el modelo anterior sigue en uso.
+
+    Args:
+        recognizer: Algoritmo de reconocimiento en uso.
+        delay: Segundos sin cambios antes de guardar el modelo.
+
+    Attributes:
+        _recognizer: Algoritmo de reconocimiento en uso.
+        _delay: Segundos sin cambios antes de guardar.
+        _lock: Bloqueo de los cambios pendientes.
+        _wake: Aviso de cambios pendientes o de detener.
+        _added: Rostros nuevos pendientes, identificador por clave.
+        _removed: Claves eliminadas pendientes.
+        _thread: Hilo que actualiza.
+        _running: ¿Está activo el hilo?
+        error: Mensaje del último error o None.
+
+    Methods:
+        start
+        stop
+        put
+        _run
+        _apply
+        _save
+
+    """
+    _recognizer = None
+    _delay = 30
+    _lock = None
+    _wake = None
+    _added = None
+    _removed = None
+    _thread = None
+    _running = False
+    error = None
+
+    def __init__(self, recognizer, delay=30):
+        self._recognizer = recognizer
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._added = {}
+        self._removed = set()
+
+    def start(self):
+        """Inicia el hilo."""
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=60):
+        """Aplica los cambios pendientes, guarda el modelo y se detiene."""
+        if self._thread is not None:
+            self._running = False
+            self._wake.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def put(self, added=(), removed=()):
+        """Encarga una actualización.
+
+        Args:
+            added: Lista de (clave, identificador de usuario) nuevos.
+            removed: Lista de claves eliminadas.
+
+        """
+        with self._lock:
+            for key in removed:
+                self._added.pop(key, None)
+                self._removed.add(key)
+            for key, label in added:
+                self._removed.discard(key)
+                self._added[key] = label
+        self._wake.set()
+
+    def _run(self):
+        """Actualiza al haber cambios y guarda tras `delay` sin cambios."""
+        due = None  # Cuándo guardar, None si está guardado
+        while self._running:
+            self._wake.wait(None if due is None else max(0, due - time()))
+            self._wake.clear()
+            if self._apply():
+                due = time() + self._delay
+            elif due is not None and time() >= due:
+                self._save()
+                due = None
+        self._apply()
+        self._save()
+
+    def _apply(self):
+        """Aplica los cambios pendientes, ¿había alguno?"""
+        with self._lock:
+            added = list(self._added.items())
+            removed = list(self._removed)
+            self._added = {}
+            self._removed = set()
+        if not added and not removed:
+            return False
+        try:
+            self._recognizer.update(added, removed)
+            self.error = None
+        except Exception as error:
+            logging.exception('No se pudo actualizar el modelo')
+            self.error = str(error)
+        return True
+
+    def _save(self):
+        """Guarda el modelo, registra el error si no se pudo."""
+        try:
+            self._recognizer.save()
+        except Exception as error:
+            logging.exception('No se pudo guardar el modelo')
+            self.error = str(error)
 
 
 class Helper(object):
     """Clase que nos ayudará en las diferentes clases.
 
     Methods:
+        store
         get_pics
+        read_pic
+        save_pic
+        remove_pic
+        remove_pics
         remove_file
         remove_dir
         set_date
         play
 
     """
+    @staticmethod
+    def store():
+        """Obtiene el almacenamiento de rostros."""
+        return store.Store.instance()
+
     @staticmethod
     def get_pics(id):
-        """Obtiene las rutas de las imágenes de un usuario."""
-        pics = []
-        with os.scandir('data/' + id) as files:
-            for file in files:
-                if file.is_file() and file.path.endswith('.jpg'):
-                    pics.append(file.path)
-        return pics
+        """Obtiene las claves de las imágenes de un usuario."""
+        return Helper.store().list(id)
+
+    @staticmethod
+    def read_pic(key):
+        """Lee un rostro en grises de 150x150, None si no se pudo."""
+        return Helper.store().read(key)
+
+    @staticmethod
+    def save_pic(id, image):
+        """Guarda un rostro de un usuario y devuelve su clave."""
+        return Helper.store().save(id, image)
+
+    @staticmethod
+    def remove_pic(key):
+        """Elimina un rostro."""
+        Helper.store().remove(key)
+
+    @staticmethod
+    def remove_pics(id):
+        """Elimina todos los rostros de un usuario."""
+        Helper.store().remove_user(id)
 
     @staticmethod
     def remove_file(path):
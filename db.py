@@ -4,27 +4,57 @@ Módulo para la conexión a base de datos SQLite desde Python.
 
 Classes:
     DB
+    Writer
 
 """
+import gzip
+import hashlib
+import json
+import logging
+import os
+import queue
 import sqlite3
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from time import sleep, time
+import metrics
 
 
 class DB(object):
     """Conexión a base de datos SQLite.
 
-    Conexión a base de datos mediante sqlite3.
+    Conexión a base de datos mediante sqlite3. Cada hilo usa su propia
+    conexión persistente en modo WAL, así los hilos de la cámara y de los
+    temporizadores pueden escribir sin compartir cursores. Los usuarios se
+    mantienen en memoria por id y por DNI, cada cambio actualiza la fila
+    afectada. Al abrir la primera conexión se aplican las migraciones
+    pendientes del esquema.
 
     Attributes:
-        _success
-        _db
-        _cur
+        _path: Archivo de la base de datos.
+        _local: Conexión y nivel de transacción de cada hilo.
+        _migrations: Sentencias de cada versión del esquema.
+        _migrated: ¿Ya se revisaron las migraciones?
+        _users: Usuarios por id.
+        _dnis: Usuarios por DNI.
+        _lock: Bloqueo de los usuarios en memoria.
 
     Methods:
         _instance
         _exec
         _getData
+        _refresh
+        _stamp
+        migrate
+        transaction
+        load_users
         user_login
         user_list
+        user_search
+        user_count
+        _user_filter
         user_delete
         user_by_id
         user_insert
@@ -35,37 +65,135 @@ class DB(object):
         user_pass_update
         event_insert
         event_denied
+        events_insert
+        snapshot
     """
-    _success = None
-    _db = None
-    _cur = None
+    _path = 'db.db'
+    _local = threading.local()
+    _migrations = [
+        # 1: Marca de tiempo de los eventos, indexada para los reportes.
+        ['ALTER TABLE events ADD COLUMN ts TEXT',
+         "UPDATE events SET ts = date || ' ' || "
+         "printf('%02d:%02d:00', hour, min)",
+         'CREATE INDEX events_ts ON events (ts)',
+         'CREATE INDEX events_user_ts ON events (user_id, ts)'],
+        # 2: Líneas del diario de eventos que ya están en la base de datos.
+        ['CREATE TABLE IF NOT EXISTS journal '
+         '(id INTEGER PRIMARY KEY CHECK (id = 1), lines INT)',
+         'INSERT OR IGNORE INTO journal VALUES(1, 0)'],
+        # 3: Resumen diario por usuario, se mantiene al insertar eventos.
+        # user_id 0 agrupa las denegaciones, gauge indica si tenía
+        # mascarilla.
+        ['CREATE TABLE daily (day DATE NOT NULL, user_id INT NOT NULL, '
+         'first TEXT, last TEXT, events INT, fever INT, max_temp DECIMAL '
+         '(4, 2), denied INT, no_mask INT, PRIMARY KEY (day, user_id))',
+         'INSERT INTO daily SELECT date, IFNULL(user_id, 0), MIN(ts), '
+         'MAX(ts), COUNT(*), SUM(IFNULL(temp, 0) > 38), MAX(temp), '
+         'SUM(user_id IS NULL AND gauge = 1), '
+         'SUM(user_id IS NULL AND gauge = 0) '
+         'FROM events GROUP BY date, IFNULL(user_id, 0)',
+         'CREATE TRIGGER events_daily AFTER INSERT ON events BEGIN '
+         'INSERT OR IGNORE INTO daily VALUES (NEW.date, '
+         'IFNULL(NEW.user_id, 0), NEW.ts, NEW.ts, 0, 0, NULL, 0, 0); '
+         'UPDATE daily SET first = MIN(first, NEW.ts), '
+         'last = MAX(last, NEW.ts), events = events + 1, '
+         'fever = fever + (IFNULL(NEW.temp, 0) > 38), '
+         'max_temp = CASE WHEN max_temp IS NULL OR NEW.temp > max_temp '
+         'THEN IFNULL(NEW.temp, max_temp) ELSE max_temp END, '
+         'denied = denied + (NEW.user_id IS NULL AND NEW.gauge = 1), '
+         'no_mask = no_mask + (NEW.user_id IS NULL AND NEW.gauge = 0) '
+         'WHERE day = NEW.date AND user_id = IFNULL(NEW.user_id, 0); '
+         'END'],
+        # 4: Marcas de sincronización y registro de usuarios modificados.
+        ['CREATE TABLE sync (name TEXT PRIMARY KEY, value INT)',
+         "INSERT INTO sync VALUES ('events', 0), ('users', 0)",
+         'CREATE TABLE user_changes '
+         '(seq INTEGER PRIMARY KEY AUTOINCREMENT, user_id INT)',
+         'INSERT INTO user_changes (user_id) SELECT id FROM users',
+         'CREATE TRIGGER users_insert AFTER INSERT ON users BEGIN '
+         'INSERT INTO user_changes (user_id) VALUES (NEW.id); END',
+         'CREATE TRIGGER users_update AFTER UPDATE ON users BEGIN '
+         'INSERT INTO user_changes (user_id) VALUES (NEW.id); END',
+         'CREATE TRIGGER users_delete AFTER DELETE ON users BEGIN '
+         'INSERT INTO user_changes (user_id) VALUES (OLD.id); END'],
+        # 5: Puerta en la que ocurrió cada evento.
+        ['ALTER TABLE events ADD COLUMN door INT NOT NULL DEFAULT 1'],
+        # 6: Búsqueda y orden de usuarios por nombre sin distinguir
+        # mayúsculas.
+        ['CREATE INDEX users_name ON users (name COLLATE NOCASE)'],
+    ]
+    _migrated = False
+    _users = None
+    _dnis = None
+    _lock = threading.Lock()
 
     @staticmethod
     def _instance():
-        """Crea una conexión a la base de datos.
+        """Obtiene la conexión del hilo actual, la crea si no existe.
 
-         Returns:
-             True or False
+        WAL permite leer mientras otro hilo escribe y, con synchronous
+        NORMAL, evita sincronizar el disco en cada commit.
+
+        Returns:
+            Conexión a la base de datos.
         """
-        if DB._success is None:
-            with sqlite3.connect('db.db') as conn:
-                DB._db = conn
-                DB._cur = conn.cursor()
-                DB._success = True
-        return DB._success
+        conn = getattr(DB._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(DB._path, timeout=5)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute('PRAGMA temp_store = MEMORY')
+            DB._local.conn = conn
+            DB._local.depth = 0
+            if not DB._migrated:
+                DB.migrate(conn)
+                DB._migrated = True
+        return conn
+
+    @staticmethod
+    def migrate(conn):
+        """Actualiza el esquema de la base de datos a la última versión.
+
+        La versión se guarda en PRAGMA user_version, cada migración se
+        aplica en su propia transacción junto con el cambio de versión.
+
+        Args:
+            conn: Conexión a la base de datos.
+        """
+        while True:
+            conn.execute('BEGIN IMMEDIATE')  # Una sola conexión migra
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= len(DB._migrations):
+                conn.rollback()
+                break
+            try:
+                for sql in DB._migrations[version]:
+                    conn.execute(sql)
+                conn.execute(f'PRAGMA user_version = {version + 1}')
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
 
     @staticmethod
     def _exec(sql, parameters=[]):
         """Ejecuta una consulta.
 
+        Confirma los cambios de inmediato, salvo dentro de una transacción.
+
         Args:
             sql: Consulta SQL
             parameters: Arreglo de valores que corresponde a cada ? de la
             consulta.
+
+        Returns:
+            Cursor de la consulta.
         """
-        if DB._instance():
-            DB._cur.execute(sql, parameters)
-            DB._db.commit()
+        conn = DB._instance()
+        cur = conn.execute(sql, parameters)
+        if DB._local.depth == 0:
+            conn.commit()
+        return cur
 
     @staticmethod
     def _getData(sql, parameters=[]):
@@ -76,10 +204,73 @@ class DB(object):
             parameters: Arreglo de valores que corresponde a cada ? de la
             consulta.
         """
-        if DB._instance():
-            return DB._cur.execute(sql, parameters).fetchall()
-        else:
-            return []
+        return DB._instance().execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def _stamp(now):
+        """Obtiene las columnas de fecha de un evento.
+
+        Args:
+            now: Fecha y hora del evento.
+
+        Returns:
+            Arreglo [date, hour, min, ts].
+        """
+        return [now.strftime('%Y-%m-%d'), now.hour, now.minute,
+                now.strftime('%Y-%m-%d %H:%M:%S')]
+
+    @staticmethod
+    def load_users():
+        """Carga todos los usuarios en memoria si aún no se cargaron."""
+        with DB._lock:
+            if DB._users is None:
+                rows = DB._getData('SELECT * FROM users')
+                DB._users = {row[0]: row for row in rows}
+                DB._dnis = {row[1]: row for row in rows}
+
+    @staticmethod
+    def _refresh(id):
+        """Vuelve a leer un usuario modificado y actualiza la memoria.
+
+        Args:
+            id: Identificador de usuario.
+        """
+        DB.load_users()
+        rows = DB._getData('SELECT * FROM users WHERE id=?', [id])
+        with DB._lock:
+            old = DB._users.pop(int(id), None)
+            if old is not None:
+                DB._dnis.pop(old[1], None)
+            for row in rows:
+                DB._users[row[0]] = row
+                DB._dnis[row[1]] = row
+
+    @staticmethod
+    @contextmanager
+    def transaction():
+        """Agrupa varias escrituras en una sola transacción.
+
+        Las escrituras dentro del bloque se confirman juntas al salir, o se
+        deshacen si ocurre un error. Los bloques anidados forman parte del
+        bloque exterior.
+
+        Example:
+            with DB.transaction():
+                DB.event_denied()
+                DB.event_denied(0)
+        """
+        conn = DB._instance()
+        DB._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            DB._local.depth -= 1
+            if DB._local.depth == 0:
+                conn.rollback()
+            raise
+        DB._local.depth -= 1
+        if DB._local.depth == 0:
+            conn.commit()
 
     @staticmethod
     def user_login(dni, passw):
@@ -108,6 +299,63 @@ class DB(object):
         sql = 'SELECT * FROM users WHERE id > 1 ORDER BY name'
         return DB._getData(sql)
 
+    @staticmethod
+    def user_search(text='', after=None, limit=100):
+        """Obtiene una página de usuarios en orden alfabético.
+
+        Cada página continúa desde el último usuario de la anterior, así
+        sólo se leen las filas que se muestran.
+
+        Args:
+            text: Inicio del nombre o del DNI, vacío para todos.
+            after: (name, id) del último usuario ya leído o None.
+            limit: Número máximo de usuarios.
+
+        Returns:
+            Arreglo con datos de los usuarios o arreglo vacío.
+
+        """
+        where, parameters = DB._user_filter(text)
+        if after is not None:
+            where += ' AND name >= ? COLLATE NOCASE ' \
+                     'AND (name COLLATE NOCASE, id) > (?, ?)'
+            parameters += [after[0], after[0], after[1]]
+        sql = f'SELECT * FROM users WHERE {where} ' \
+              'ORDER BY name COLLATE NOCASE, id LIMIT ?'
+        return DB._getData(sql, parameters + [limit])
+
+    @staticmethod
+    def user_count(text=''):
+        """Cuenta los usuarios que coinciden con una búsqueda.
+
+        Args:
+            text: Inicio del nombre o del DNI, vacío para todos.
+
+        """
+        where, parameters = DB._user_filter(text)
+        return DB._getData(f'SELECT COUNT(*) FROM users WHERE {where}',
+                           parameters)[0][0]
+
+    @staticmethod
+    def _user_filter(text):
+        """Condición de búsqueda de usuarios.
+
+        Sólo dígitos busca por el inicio del DNI, otro texto por el inicio
+        del nombre; ambas búsquedas usan un índice.
+
+        Returns:
+            Tupla (condición SQL, parámetros).
+
+        """
+        text = text.strip()
+        if not text:
+            return 'id > 1', []
+        if text.isdigit():
+            return 'id > 1 AND dni GLOB ?', [text + '*']
+        text = text.replace('\\', '\\\\').replace('%', '\\%') \
+            .replace('_', '\\_')
+        return "id > 1 AND name LIKE ? ESCAPE '\\'", [text + '%']
+
     @staticmethod
     def user_delete(id):
         """Elimina un usuario por id.
@@ -116,6 +364,7 @@ class DB(object):
             id: Identificador de usuario.
         """
         DB._exec('DELETE FROM users WHERE id=?', [id])
+        DB._refresh(id)
 
     @staticmethod
     def user_by_id(id):
@@ -128,7 +377,9 @@ class DB(object):
             Arreglo con datos del usuario o arreglo vacío.
 
         """
-        return DB._getData('SELECT * FROM users WHERE id=?', [id])
+        DB.load_users()
+        user = DB._users.get(int(id))
+        return [user] if user is not None else []
 
     @staticmethod
     def user_insert(dni, name, rol, passw):
@@ -145,8 +396,9 @@ class DB(object):
 
         """
         sql = 'INSERT INTO users VALUES(NULL, ?, ?, ?, ?, 0)'
-        DB._exec(sql, [dni, name, rol, passw])
-        return DB._cur.lastrowid
+        id = DB._exec(sql, [dni, name, rol, passw]).lastrowid
+        DB._refresh(id)
+        return id
 
     @staticmethod
     def user_by_dni(dni):
@@ -159,7 +411,9 @@ class DB(object):
             Arreglo con datos del usuario o arreglo vacío.
 
         """
-        return DB._getData('SELECT * FROM users WHERE dni=?', [dni])
+        DB.load_users()
+        user = DB._dnis.get(dni)
+        return [user] if user is not None else []
 
     @staticmethod
     def user_update(id, dni, name, role, passw):
@@ -175,6 +429,7 @@ class DB(object):
         """
         sql = 'UPDATE users SET dni=?, name=?, role=?, pass=? WHERE id=?'
         DB._exec(sql, [dni, name, role, passw, id])
+        DB._refresh(id)
 
     @staticmethod
     def user_pic_delete(id):
@@ -186,6 +441,7 @@ class DB(object):
         """
         sql = 'UPDATE users SET face = face - 1 WHERE id = ?'
         DB._exec(sql, [id])
+        DB._refresh(id)
 
     @staticmethod
     def user_pic_add(id):
@@ -197,6 +453,7 @@ class DB(object):
         """
         sql = 'UPDATE users SET face = face + 1 WHERE id = ?'
         DB._exec(sql, [id])
+        DB._refresh(id)
 
     @staticmethod
     def user_pass_update(passw, id):
@@ -209,9 +466,10 @@ class DB(object):
         """
         sql = 'UPDATE users SET pass = ? WHERE id = ?'
         DB._exec(sql, [passw, id])
+        DB._refresh(id)
 
     @staticmethod
-    def event_insert(user_id, temp, detect, gauge):
+    def event_insert(user_id, temp, detect, gauge, door=1):
         """Inserta un evento de usuario.
 
         Args:
@@ -219,23 +477,326 @@ class DB(object):
             temp: Temperatura.
             detect: Tiempo de identificación.
             gauge: Tiempo de toma de temperatura.
+            door: Identificador de la puerta.
 
         """
-        sql = "INSERT INTO events VALUES(NULL, ?, date('now','localtime'), " \
-              "strftime('%H', time('now','localtime')), " \
-              "strftime('%M', time('now','localtime')), ?, ?, ?)"
-        DB._exec(sql, [user_id, temp, detect, gauge])
+        DB.events_insert([[user_id] + DB._stamp(datetime.now())
+                          + [temp, detect, gauge, door]])
 
     @staticmethod
-    def event_denied(with_mask=1):
+    def event_denied(with_mask=1, door=1):
         """Inserta un evento de denegación.
 
         Args:
             mask: Detectó mascarilla.
+            door: Identificador de la puerta.
+
+        """
+        DB.events_insert([[None] + DB._stamp(datetime.now())
+                          + [None, None, with_mask, door]])
+
+    @staticmethod
+    def events_insert(rows):
+        """Inserta varios eventos con su fecha ya registrada.
+
+        Args:
+            rows: Lista de filas (user_id, date, hour, min, ts, temp,
+            detect, gauge, door).
+
+        """
+        sql = 'INSERT INTO events (user_id, date, hour, min, ts, temp, ' \
+              'detect, gauge, door) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)'
+        DB._instance().executemany(sql, rows)
+        if DB._local.depth == 0:
+            DB._instance().commit()
+
+    @staticmethod
+    def snapshot(path, compress=False):
+        """Copia la base de datos mientras sigue en uso.
+
+        Usa la API de respaldo de SQLite en un solo paso: en modo WAL la
+        lectura ve un estado consistente y no detiene a los hilos que
+        registran eventos. La copia se verifica, se comprime si se pide y
+        se mueve a su destino sólo al terminar; junto a ella se escribe
+        path.sha256 en el formato de sha256sum.
+
+        Args:
+            path: Archivo destino.
+            compress: ¿Comprimir con gzip?
+
+        Returns:
+            Suma sha256 del archivo escrito.
+
+        Raises:
+            sqlite3.DatabaseError: Si la copia no pasa la verificación.
+
+        """
+        tmp = path + '.tmp'
+        copy = tmp + '.db' if compress else tmp
+        if os.path.exists(copy):
+            os.remove(copy)
+        source = sqlite3.connect(DB._path, timeout=5)
+        target = sqlite3.connect(copy)
+        try:
+            source.backup(target)
+            target.execute('PRAGMA journal_mode = DELETE')  # Un solo archivo
+            check = target.execute('PRAGMA quick_check').fetchone()[0]
+            if check != 'ok':
+                raise sqlite3.DatabaseError(check)
+        finally:
+            target.close()
+            source.close()
+        if compress:
+            with open(copy, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.remove(copy)
+        digest = hashlib.sha256()
+        with open(tmp, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        os.replace(tmp, path)
+        with open(path + '.sha256', 'w') as file:
+            file.write(f'{digest.hexdigest()}  {os.path.basename(path)}\n')
+        return digest.hexdigest()
+
+
+class Writer(object):
+    """Escribe los eventos en segundo plano.
+
+    Cada evento se agrega a un diario en disco y a una cola en memoria, y
+    la puerta continúa sin esperar a SQLite. Un hilo escritor inserta los
+    eventos de la cola por lotes en una sola transacción, junto con el
+    número de líneas del diario ya guardadas; así, si la aplicación se
+    cae, al iniciar sólo se vuelven a insertar las líneas pendientes. El
+    diario se vacía cuando no queda nada por escribir: primero se marca el
+    contador con -1 (todo el diario está guardado), luego se vacía el
+    archivo y al final se pone el contador en 0, así un corte en medio no
+    pierde ni repite eventos. Los errores de la base de datos se registran
+    y el lote se reintenta, el hilo no se detiene.
+
+    Args:
+        path: Archivo del diario.
+        interval: Segundos que se espera para juntar un lote.
+        size: Número máximo de eventos por lote.
+
+    Attributes:
+        _path: Archivo del diario.
+        _interval: Espera para juntar un lote.
+        _size: Máximo de eventos por lote.
+        _queue: Eventos pendientes.
+        _lock: Bloqueo del diario y la cola.
+        _journal: Diario abierto para agregar líneas.
+        _thread: Hilo escritor.
+        _running: ¿Está activo el hilo?
+        flushed: Eventos escritos.
+        batches: Lotes escritos.
+        last_batch: Eventos del último lote.
+        last_latency: Segundos que tardó el último lote.
+        error: Mensaje del último error o None.
+
+    Methods:
+        start
+        stop
+        flush
+        backlog
+        stats
+        event_insert
+        event_denied
+        _put
+        _replay
+        _run
+        _write
+        _clear
+
+    """
+    _path = None
+    _interval = 0.5
+    _size = 100
+    _queue = None
+    _lock = None
+    _journal = None
+    _thread = None
+    _running = False
+    flushed = 0
+    batches = 0
+    last_batch = 0
+    last_latency = 0
+    error = None
+
+    def __init__(self, path='events.journal', interval=0.5, size=100):
+        self._path = path
+        self._interval = interval
+        self._size = size
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Recupera los eventos pendientes del diario e inicia el hilo."""
+        if self._thread is None:
+            self._replay()
+            self._journal = open(self._path, 'a', buffering=1)
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Escribe los eventos pendientes y detiene el hilo.
+
+        Si el hilo sigue reintentando al pasar `timeout`, el diario queda
+        abierto y los eventos pendientes se recuperan al volver a iniciar.
+
+        """
+        if self._thread is not None:
+            self._running = False
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logging.error('Quedaron %d eventos sin guardar, siguen en el '
+                              'diario', self.backlog())
+                return
+            self._thread = None
+            self._journal.close()
+
+    def flush(self, timeout=5):
+        """Espera a que se escriban los eventos pendientes.
+
+        Returns:
+            True si no quedó nada por escribir.
+
+        """
+        limit = time() + timeout
+        while self._queue.unfinished_tasks and time() < limit:
+            sleep(0.05)
+        return not self._queue.unfinished_tasks
+
+    def backlog(self):
+        """Número de eventos pendientes de escribir."""
+        return self._queue.unfinished_tasks
+
+    def stats(self):
+        """Métricas del escritor.
+
+        Returns:
+            Diccionario con pendientes, escritos, lotes, tamaño y segundos
+            del último lote.
+
+        """
+        return {'backlog': self.backlog(), 'flushed': self.flushed,
+                'batches': self.batches, 'last_batch': self.last_batch,
+                'last_latency': self.last_latency}
+
+    def event_insert(self, user_id, temp, detect, gauge, door=1):
+        """Registra un evento de usuario.
+
+        Args:
+            user_id: Identificador de usuario.
+            temp: Temperatura.
+            detect: Tiempo de identificación.
+            gauge: Tiempo de toma de temperatura.
+            door: Identificador de la puerta.
 
         """
-        sql = "INSERT INTO events VALUES(NULL, NULL, " \
-              "date('now','localtime'), " \
-              "strftime('%H', time('now','localtime')), " \
-              "strftime('%M', time('now','localtime')), NULL, NULL, ?)"
-        DB._exec(sql, [with_mask])
+        self._put([user_id, temp, detect, gauge, door])
+
+    def event_denied(self, with_mask=1, door=1):
+        """Registra un evento de denegación.
+
+        Args:
+            with_mask: Detectó mascarilla.
+            door: Identificador de la puerta.
+
+        """
+        self._put([None, None, None, with_mask, door])
+
+    def _put(self, values):
+        """Agrega un evento con la hora actual al diario y a la cola."""
+        row = [values[0]] + DB._stamp(datetime.now()) + values[1:]
+        with self._lock:
+            self._journal.write(json.dumps(row) + '\n')
+            self._queue.put(row)
+
+    def _replay(self):
+        """Encola las líneas del diario que no llegaron a la base de datos."""
+        saved = DB._getData('SELECT lines FROM journal')[0][0]
+        if not os.path.isfile(self._path):
+            data = b''
+        else:
+            with open(self._path, 'rb+') as journal:
+                data = journal.read()
+                journal.truncate(data.rfind(b'\n') + 1)  # Línea incompleta
+        if saved < 0:  # Se cortó mientras se vaciaba, todo está guardado
+            with open(self._path, 'w'):
+                pass
+            DB._exec('UPDATE journal SET lines = 0')
+            return
+        for line in data.splitlines(True)[saved:]:
+            if not line.endswith(b'\n'):
+                break
+            row = json.loads(line)
+            if len(row) == 7:  # Diario anterior a la columna ts
+                row[4:4] = [f'{row[1]} {row[2]:02d}:{row[3]:02d}:00']
+            if len(row) == 8:  # Diario anterior a la columna door
+                row.append(1)
+            self._queue.put(row)
+
+    def _run(self):
+        """Escribe lotes mientras el hilo esté activo o queden eventos."""
+        while self._running or self._queue.unfinished_tasks:
+            try:
+                batch = [self._queue.get(timeout=self._interval)]
+            except queue.Empty:
+                continue
+            sleep(self._interval)  # Juntar los eventos cercanos
+            while len(batch) < self._size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch):
+        """Escribe un lote, reintenta hasta lograrlo."""
+        while True:
+            try:
+                start = time()
+                os.fsync(self._journal.fileno())
+                with DB.transaction():
+                    DB.events_insert(batch)
+                    DB._exec('UPDATE journal SET lines = MAX(lines, 0) + ?',
+                             [len(batch)])  # -1 es un diario ya vaciado
+                break
+            except (sqlite3.Error, OSError, ValueError) as error:
+                if (isinstance(error, sqlite3.OperationalError) and
+                        ('locked' in str(error) or 'busy' in str(error))):
+                    sleep(1)  # Base de datos ocupada, reintentar
+                    continue
+                logging.exception('No se pudo guardar un lote de eventos')
+                self.error = str(error)
+                sleep(5)  # Los eventos siguen en el diario y en la cola
+        self.error = None
+        self.flushed += len(batch)
+        self.batches += 1
+        self.last_batch = len(batch)
+        self.last_latency = time() - start
+        metrics.Metrics.instance().observe('db.write', self.last_latency)
+        metrics.Metrics.instance().count('db.events', len(batch))
+        with self._lock:
+            if self._queue.qsize() == 0:  # Todo está en la base de datos
+                self._clear()
+
+    def _clear(self):
+        """Vacía el diario, llamar con el bloqueo tomado."""
+        try:
+            saved = DB._getData('SELECT lines FROM journal')[0][0]
+            DB._exec('UPDATE journal SET lines = -1')
+            try:
+                self._journal.truncate(0)
+            except OSError:
+                DB._exec('UPDATE journal SET lines = ?', [saved])
+                raise
+            DB._exec('UPDATE journal SET lines = 0')
+        except (sqlite3.Error, OSError) as error:
+            # Se vuelve a intentar al vaciarse la cola otra vez
+            logging.exception('No se pudo vaciar el diario de eventos')
+            self.error = str(error)
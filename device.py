@@ -0,0 +1,328 @@
+"""Cámaras y sensores de temperatura.
+
+Abre la cámara y el sensor reales de la Raspberry Pi o fuentes simuladas
+que permiten ejecutar el reconocimiento en cualquier equipo: un video, una
+carpeta de imágenes, cuadros sintéticos y un sensor con lecturas fijas.
+
+Classes:
+    Device
+    VideoSource
+    ImageSource
+    SyntheticSource
+    FakeSensor
+
+"""
+import os
+import cv2
+import numpy as np
+from time import sleep, time
+try:
+    from smbus2 import SMBus
+    from mlx90614 import MLX90614
+except ImportError:  # Fuera de la Raspberry Pi
+    SMBus = None
+    MLX90614 = None
+
+WIDTH = 640  # Tamaño de los cuadros de la cámara, de costado
+HEIGHT = 480
+
+
+class Device(object):
+    """Abre la cámara y el sensor según la configuración.
+
+    Methods:
+        camera
+        sensor
+        to_camera
+
+    """
+
+    @staticmethod
+    def camera(source=0, fps=30):
+        """Abre una fuente de cuadros.
+
+        Args:
+            source: Número de cámara, 'video:archivo', 'images:carpeta' o
+            'synthetic' (también 'synthetic:imagen' con un rostro).
+            fps: Cuadros por segundo de las fuentes simuladas, 0 sin pausa.
+
+        Returns:
+            Objeto con read, isOpened y release como cv2.VideoCapture.
+
+        Raises:
+            ValueError: Si la fuente no existe o no se puede abrir.
+
+        """
+        if isinstance(source, int):
+            cap = cv2.VideoCapture(source)
+        else:
+            kind, _, arg = source.partition(':')
+            if kind == 'video':
+                cap = VideoSource(arg, fps)
+            elif kind == 'images':
+                cap = ImageSource(arg, fps)
+            elif kind == 'synthetic':
+                cap = SyntheticSource(arg or None, fps)
+            else:
+                raise ValueError('Fuente de cuadros desconocida: ' + source)
+        if not cap.isOpened():
+            raise ValueError('Cámara no encontrada.')
+        return cap
+
+    @staticmethod
+    def sensor(name='mlx90614', readings=None, address=0x5A):
+        """Abre un sensor de temperatura.
+
+        Args:
+            name: 'mlx90614' para el sensor del bus I2C o 'fake'.
+            readings: Lecturas del sensor simulado.
+            address: Dirección I2C del sensor, distinta en cada puerta.
+
+        Returns:
+            Objeto con get_object_1 y get_ambient.
+
+        Raises:
+            ValueError: Si el sensor no existe o faltan sus librerías.
+
+        """
+        if name == 'fake':
+            return FakeSensor(readings or [26.3])
+        if name != 'mlx90614':
+            raise ValueError('Sensor desconocido: ' + name)
+        if MLX90614 is None:
+            raise ValueError('Instale smbus2 y PyMLX90614 para usar el '
+                             'sensor MLX90614.')
+        return MLX90614(SMBus(1), address=address)
+
+    @staticmethod
+    def to_camera(image):
+        """Convierte una imagen derecha en un cuadro como el de la cámara.
+
+        La imagen se centra en el área visible de 480x640 y se aplica la
+        inversa del giro y espejo de cv.Frame.
+
+        Args:
+            image: Imagen BGR o en grises vista de frente.
+
+        Returns:
+            Cuadro BGR de 480x640 de costado.
+
+        """
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        h, w = image.shape[:2]
+        scale = min(HEIGHT / w, WIDTH / h)
+        image = cv2.resize(image, (round(w * scale), round(h * scale)))
+        h, w = image.shape[:2]
+        view = np.zeros((WIDTH, HEIGHT, 3), np.uint8)
+        y, x = (WIDTH - h) // 2, (HEIGHT - w) // 2
+        view[y:y + h, x:x + w] = image
+        return cv2.transpose(cv2.flip(view, -1))
+
+
+class VideoSource(object):
+    """Lee cuadros de un archivo de video y vuelve a empezar al terminar.
+
+    Args:
+        path: Archivo de video con cuadros de la cámara.
+        fps: Cuadros por segundo, 0 sin pausa.
+
+    Attributes:
+        _cap: Lector del video.
+        _pace: Ritmo de entrega de cuadros.
+
+    Methods:
+        isOpened
+        read
+        release
+
+    """
+    _cap = None
+    _pace = None
+
+    def __init__(self, path, fps=30):
+        self._cap = cv2.VideoCapture(path)
+        self._pace = _Pace(fps)
+
+    def isOpened(self):
+        """¿Se pudo abrir el video?"""
+        return self._cap.isOpened()
+
+    def read(self):
+        """Lee el siguiente cuadro."""
+        self._pace.wait()
+        ok, frame = self._cap.read()
+        if not ok:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Repetir
+            ok, frame = self._cap.read()
+        return ok, frame
+
+    def release(self):
+        """Cierra el video."""
+        self._cap.release()
+
+
+class ImageSource(object):
+    """Entrega en ciclo las imágenes de una carpeta.
+
+    Las imágenes de 640x480 se usan como cuadros de la cámara, las demás se
+    consideran vistas de frente y se convierten con Device.to_camera.
+
+    Args:
+        path: Carpeta con las imágenes, se recorre en orden alfabético.
+        fps: Cuadros por segundo, 0 sin pausa.
+
+    Attributes:
+        _frames: Cuadros leídos.
+        _next: Posición del siguiente cuadro.
+        _pace: Ritmo de entrega de cuadros.
+
+    Methods:
+        isOpened
+        read
+        release
+
+    """
+    _frames = None
+    _next = 0
+    _pace = None
+
+    def __init__(self, path, fps=30):
+        self._frames = []
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                image = cv2.imread(os.path.join(path, name))
+                if image is None:
+                    continue  # No es una imagen
+                if image.shape[:2] != (HEIGHT, WIDTH):
+                    image = Device.to_camera(image)
+                self._frames.append(image)
+        self._pace = _Pace(fps)
+
+    def isOpened(self):
+        """¿Hay imágenes?"""
+        return len(self._frames) > 0
+
+    def read(self):
+        """Lee el siguiente cuadro."""
+        self._pace.wait()
+        frame = self._frames[self._next]
+        self._next = (self._next + 1) % len(self._frames)
+        return True, frame.copy()
+
+    def release(self):
+        """Libera las imágenes."""
+        self._frames = []
+
+
+class SyntheticSource(object):
+    """Genera cuadros sin cámara.
+
+    Dibuja un fondo con ruido y un rostro que se desplaza lentamente; el
+    rostro es una imagen dada o una elipse si no se indica ninguna.
+
+    Args:
+        face: Imagen de un rostro de frente o None.
+        fps: Cuadros por segundo, 0 sin pausa.
+
+    Attributes:
+        _face: Rostro en escala de 480x480 o None.
+        _count: Cuadros generados.
+        _rng: Generador del ruido.
+        _pace: Ritmo de entrega de cuadros.
+
+    Methods:
+        isOpened
+        read
+        release
+
+    """
+    _face = None
+    _count = 0
+    _rng = None
+    _pace = None
+
+    def __init__(self, face=None, fps=30):
+        if face is not None:
+            image = cv2.imread(face)
+            if image is not None:
+                self._face = cv2.resize(image, (HEIGHT, HEIGHT))
+        self._rng = np.random.default_rng(0)
+        self._pace = _Pace(fps)
+
+    def isOpened(self):
+        """Siempre disponible."""
+        return True
+
+    def read(self):
+        """Genera el siguiente cuadro."""
+        self._pace.wait()
+        view = self._rng.integers(40, 80, (WIDTH, HEIGHT, 3), np.uint8)
+        dy = round(40 * np.sin(self._count / 15))  # Vaivén vertical
+        y = (WIDTH - HEIGHT) // 2 + dy
+        if self._face is not None:
+            view[y:y + HEIGHT] = self._face
+        else:
+            cv2.ellipse(view, (HEIGHT // 2, y + HEIGHT // 2), (170, 220), 0,
+                        0, 360, (150, 170, 200), -1)
+        self._count += 1
+        return True, cv2.transpose(cv2.flip(view, -1))
+
+    def release(self):
+        """Nada que liberar."""
+
+
+class FakeSensor(object):
+    """Sensor de temperatura con lecturas fijas.
+
+    Repite en ciclo las lecturas indicadas, igual que un MLX90614 sin
+    calibrar; útil para pruebas y para medir el rendimiento.
+
+    Args:
+        readings: Lecturas del objeto en grados.
+        ambient: Temperatura ambiente en grados.
+
+    Attributes:
+        _readings: Lecturas del objeto.
+        _ambient: Temperatura ambiente.
+        _next: Posición de la siguiente lectura.
+
+    Methods:
+        get_object_1
+        get_ambient
+
+    """
+    _readings = None
+    _ambient = 25
+    _next = 0
+
+    def __init__(self, readings, ambient=25):
+        self._readings = list(readings)
+        self._ambient = ambient
+
+    def get_object_1(self):
+        """Siguiente lectura del objeto."""
+        value = self._readings[self._next]
+        self._next = (self._next + 1) % len(self._readings)
+        return value
+
+    def get_ambient(self):
+        """Temperatura ambiente."""
+        return self._ambient
+
+
+class _Pace(object):
+    """Espera lo necesario para entregar cuadros a un ritmo fijo."""
+    _interval = 0
+    _last = 0
+
+    def __init__(self, fps):
+        self._interval = 1 / fps if fps else 0
+
+    def wait(self):
+        """Espera hasta el siguiente cuadro."""
+        if self._interval:
+            delay = self._last + self._interval - time()
+            if delay > 0:
+                sleep(delay)
+            self._last = max(self._last + self._interval, time())
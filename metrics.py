@@ -0,0 +1,296 @@
+"""Métricas del control de acceso.
+
+Registra duraciones en histogramas, contadores de sucesos y valores
+instantáneos, y los publica cada cierto tiempo en un archivo de registro y,
+opcionalmente, en una dirección HTTP local.
+
+Classes:
+    Histogram
+    Metrics
+
+"""
+import json
+import os
+import threading
+from bisect import bisect_left
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+import numpy as np
+
+
+class Histogram(object):
+    """Histograma de duraciones con intervalos logarítmicos.
+
+    Los límites van de 0,1 ms a 10 s, los percentiles se estiman con el
+    límite superior del intervalo, suficiente para ver si algo se degrada.
+
+    Attributes:
+        bounds: Límites superiores de los intervalos en segundos.
+        counts: Cantidad de valores en cada intervalo, el último sin límite.
+        total: Suma de los valores.
+        max: Mayor valor.
+
+    Methods:
+        observe
+        summary
+
+    """
+    bounds = list(np.geomspace(1e-4, 10, 51))
+    counts = None
+    total = 0
+    max = 0
+
+    def __init__(self):
+        self.counts = np.zeros(len(self.bounds) + 1, np.int64)
+
+    def observe(self, seconds):
+        """Agrega una duración."""
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self, counts=None, total=None):
+        """Resumen en milisegundos.
+
+        Args:
+            counts: Conteos a resumir, por defecto los acumulados.
+            total: Suma de los valores de `counts`.
+
+        Returns:
+            Diccionario con count, mean, p50, p95 y p99.
+
+        """
+        if counts is None:
+            counts, total = self.counts, self.total
+        count = int(counts.sum())
+        if count == 0:
+            return {'count': 0}
+        cumulative = np.cumsum(counts)
+        result = {'count': count, 'mean': round(total / count * 1000, 2)}
+        for p in [50, 95, 99]:
+            i = int(np.searchsorted(cumulative, count * p / 100))
+            bound = self.bounds[i] if i < len(self.bounds) else self.max
+            result[f'p{p}'] = round(min(bound, self.max) * 1000, 2)
+        return result
+
+
+class Metrics(object):
+    """Registro único de métricas.
+
+    Los nombres se agrupan con puntos, por ejemplo 'recognize.face'. Los
+    contadores terminados en '.hit' y '.miss' se publican además como tasa
+    de aciertos. Cada publicación incluye los valores acumulados y los del
+    último intervalo.
+
+    Attributes:
+        _instance: Instancia única.
+        _lock: Bloqueo de los registros.
+        _histograms: Histogramas por nombre.
+        _counters: Contadores por nombre.
+        _gauges: Funciones que entregan un valor instantáneo por nombre.
+        _last: Estado en la publicación anterior.
+        _thread: Hilo que publica en el archivo.
+        _server: Servidor HTTP local o None.
+        _running: ¿Está publicando?
+        _max_bytes: Tamaño máximo del archivo antes de rotarlo.
+        _backups: Archivos rotados que se conservan.
+
+    Methods:
+        instance
+        observe
+        count
+        gauge
+        snapshot
+        start
+        stop
+        _run
+        _rotate
+
+    """
+    _instance = None
+    _lock = None
+    _histograms = None
+    _counters = None
+    _gauges = None
+    _last = None
+    _thread = None
+    _server = None
+    _running = False
+    _max_bytes = 1 << 20
+    _backups = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._last = {'time': time(), 'histograms': {}, 'counters': {}}
+
+    @staticmethod
+    def instance():
+        """Obtiene la instancia única."""
+        if Metrics._instance is None:
+            Metrics._instance = Metrics()
+        return Metrics._instance
+
+    def observe(self, name, seconds):
+        """Registra una duración.
+
+        Args:
+            name: Nombre de la métrica.
+            seconds: Duración en segundos.
+
+        """
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, n=1):
+        """Suma sucesos a un contador.
+
+        Args:
+            name: Nombre del contador.
+            n: Cantidad de sucesos.
+
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name, function):
+        """Registra una función que entrega un valor instantáneo.
+
+        Args:
+            name: Nombre del valor, por ejemplo 'writer.backlog'.
+            function: Función sin argumentos que se llama al publicar.
+
+        """
+        with self._lock:
+            self._gauges[name] = function
+
+    def snapshot(self, advance=False):
+        """Estado actual de las métricas.
+
+        Args:
+            advance: ¿Empezar un nuevo intervalo?
+
+        Returns:
+            Diccionario serializable en JSON.
+
+        """
+        now = time()
+        with self._lock:
+            histograms = {k: (h.counts.copy(), h.total)
+                          for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            last = self._last
+            if advance:
+                self._last = {'time': now, 'histograms': histograms,
+                              'counters': counters}
+        elapsed = max(now - last['time'], 1e-9)
+        result = {'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                  'interval': round(elapsed, 1), 'latency': {},
+                  'counters': counters, 'rates': {}, 'hit_rates': {},
+                  'gauges': {}}
+        for name, (counts, total) in sorted(histograms.items()):
+            before = last['histograms'].get(name, (0, 0))
+            histogram = self._histograms[name]
+            result['latency'][name] = {
+                'total': histogram.summary(counts, total),
+                'window': histogram.summary(counts - before[0],
+                                            total - before[1])}
+        for name, value in sorted(counters.items()):
+            delta = value - last['counters'].get(name, 0)
+            result['rates'][name] = round(delta / elapsed, 2)
+            base, _, kind = name.rpartition('.')
+            if kind in ['hit', 'miss']:
+                hit = counters.get(base + '.hit', 0)
+                miss = counters.get(base + '.miss', 0)
+                result['hit_rates'][base] = round(hit / (hit + miss), 3)
+        for name, function in sorted(gauges.items()):
+            try:
+                result['gauges'][name] = function()
+            except Exception as error:
+                result['gauges'][name] = str(error)
+        return result
+
+    def start(self, path=None, interval=60, port=None, max_bytes=1 << 20,
+              backups=3):
+        """Publica las métricas.
+
+        Args:
+            path: Archivo al que se agrega una línea JSON en cada intervalo,
+            None no escribe.
+            interval: Segundos entre publicaciones.
+            port: Puerto HTTP en 127.0.0.1 que responde el estado actual,
+            None no atiende.
+            max_bytes: Tamaño al que el archivo se rota a path.1, path.2,
+            etc.
+            backups: Archivos rotados que se conservan, el más antiguo se
+            elimina.
+
+        """
+        self._max_bytes = max_bytes
+        self._backups = backups
+        if port is not None and self._server is None:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = json.dumps(metrics.snapshot(), indent=1).encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass  # Sin mensajes por consulta
+
+            self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+            threading.Thread(target=self._server.serve_forever,
+                             daemon=True).start()
+        if path is not None and self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                                            args=(path, interval),
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Deja de publicar."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(1)
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _run(self, path, interval):
+        """Agrega una línea al archivo en cada intervalo."""
+        due = time() + interval
+        while self._running:
+            if time() < due:
+                sleep(max(0, min(0.5, due - time())))  # Atento a stop
+                continue
+            due += interval
+            line = json.dumps(self.snapshot(True)) + '\n'
+            if os.path.isfile(path) and \
+                    os.path.getsize(path) + len(line) > self._max_bytes:
+                self._rotate(path)
+            with open(path, 'a') as file:
+                file.write(line)
+
+    def _rotate(self, path):
+        """Pasa path a path.1, path.1 a path.2... y elimina el último."""
+        for i in range(self._backups, 0, -1):
+            source = f'{path}.{i - 1}' if i > 1 else path
+            if os.path.isfile(source):
+                os.replace(source, f'{path}.{i}')
+        if not self._backups:
+            os.remove(path)
@@ -0,0 +1,119 @@
+"""Reportes de asistencia.
+
+Consultas para recursos humanos sobre la tabla daily, que resume por día
+y usuario los eventos a medida que se insertan, así un reporte mensual no
+recorre todos los eventos.
+
+Classes:
+    Report
+
+"""
+import db
+
+
+class Report(object):
+    """Reportes de asistencia por rango de fechas.
+
+    Las fechas se indican como texto 'AAAA-MM-DD' u objetos date, ambos
+    extremos se incluyen.
+
+    Methods:
+        attendance
+        late
+        fever
+        denied
+        summary
+    """
+
+    @staticmethod
+    def attendance(start, end, user_id=None):
+        """Primera entrada y última salida de cada usuario por día.
+
+        Args:
+            start: Fecha inicial.
+            end: Fecha final.
+            user_id: Identificador de usuario, None para todos.
+
+        Returns:
+            Arreglo de (día, id, nombre, primera marca, última marca).
+
+        """
+        sql = 'SELECT day, user_id, name, first, last FROM daily ' \
+              'JOIN users ON users.id = daily.user_id ' \
+              'WHERE day BETWEEN ? AND ?'
+        parameters = [str(start), str(end)]
+        if user_id is not None:
+            sql += ' AND user_id = ?'
+            parameters.append(user_id)
+        return db.DB._getData(sql + ' ORDER BY day, name', parameters)
+
+    @staticmethod
+    def late(start, end, hour='08:00'):
+        """Llegadas tarde.
+
+        Args:
+            start: Fecha inicial.
+            end: Fecha final.
+            hour: Hora de ingreso 'HH:MM'.
+
+        Returns:
+            Arreglo de (día, id, nombre, primera marca).
+
+        """
+        sql = 'SELECT day, user_id, name, first FROM daily ' \
+              'JOIN users ON users.id = daily.user_id ' \
+              'WHERE day BETWEEN ? AND ? ' \
+              "AND substr(first, 12, 5) > ? ORDER BY day, first"
+        return db.DB._getData(sql, [str(start), str(end), hour])
+
+    @staticmethod
+    def fever(start, end):
+        """Usuarios con temperatura mayor a 38 grados.
+
+        Args:
+            start: Fecha inicial.
+            end: Fecha final.
+
+        Returns:
+            Arreglo de (día, id, nombre, veces, temperatura máxima).
+
+        """
+        sql = 'SELECT day, user_id, name, fever, max_temp FROM daily ' \
+              'JOIN users ON users.id = daily.user_id ' \
+              'WHERE day BETWEEN ? AND ? AND fever > 0 ORDER BY day, name'
+        return db.DB._getData(sql, [str(start), str(end)])
+
+    @staticmethod
+    def denied(start, end):
+        """Denegaciones por día.
+
+        Args:
+            start: Fecha inicial.
+            end: Fecha final.
+
+        Returns:
+            Arreglo de (día, rostro no reconocido, sin mascarilla).
+
+        """
+        sql = 'SELECT day, denied, no_mask FROM daily ' \
+              'WHERE user_id = 0 AND day BETWEEN ? AND ? ORDER BY day'
+        return db.DB._getData(sql, [str(start), str(end)])
+
+    @staticmethod
+    def summary(start, end):
+        """Resumen por usuario, por ejemplo de un mes.
+
+        Args:
+            start: Fecha inicial.
+            end: Fecha final.
+
+        Returns:
+            Arreglo de (id, nombre, días asistidos, marcas, días con
+            fiebre, temperatura máxima).
+
+        """
+        sql = 'SELECT user_id, name, COUNT(*), SUM(events), ' \
+              'SUM(fever > 0), MAX(max_temp) FROM daily ' \
+              'JOIN users ON users.id = daily.user_id ' \
+              'WHERE day BETWEEN ? AND ? GROUP BY user_id ORDER BY name'
+        return db.DB._getData(sql, [str(start), str(end)])
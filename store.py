@@ -0,0 +1,480 @@
+"""Almacenamiento de los rostros de los usuarios.
+
+Los rostros son miniaturas de 150x150 en escala de grises. Se guardan como
+archivos JPEG en data/<usuario>/ o, para no recorrer miles de archivos
+pequeños en la tarjeta SD, todos juntos en un único archivo empaquetado
+que sólo crece al final y se lee mapeado en memoria.
+
+Example:
+    python3 store.py import     # Copia data/<usuario>/*.jpg al paquete
+    python3 store.py compact    # Quita los rostros eliminados del paquete
+
+Classes:
+    Store
+    FileStore
+    PackStore
+
+"""
+import argparse
+import os
+import threading
+from datetime import datetime
+from shutil import rmtree
+import cv2
+import numpy as np
+import config
+
+SIZE = 150  # Lado de las miniaturas
+
+
+class Store(object):
+    """Abre el almacenamiento de rostros según la configuración.
+
+    Todos los almacenamientos identifican cada rostro con una clave de
+    texto: la ruta del archivo o 'pack:<número>'. Las claves no cambian
+    mientras el rostro exista, así los modelos las usan para actualizarse.
+
+    Attributes:
+        _instance: Almacenamiento abierto.
+        _lock: Bloqueo de la apertura.
+
+    Methods:
+        instance
+        create
+
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def instance():
+        """Obtiene el almacenamiento indicado en config.FACE_STORE."""
+        with Store._lock:
+            if Store._instance is None:
+                Store._instance = Store.create(config.FACE_STORE)
+        return Store._instance
+
+    @staticmethod
+    def create(name, folder='data'):
+        """Crea un almacenamiento de rostros.
+
+        Args:
+            name: 'files' para un JPEG por rostro o 'pack' para un archivo
+            empaquetado.
+            folder: Carpeta de los rostros.
+
+        Returns:
+            FileStore o PackStore.
+
+        Raises:
+            ValueError: Si el almacenamiento no existe.
+
+        """
+        if name == 'files':
+            return FileStore(folder)
+        if name == 'pack':
+            return PackStore(os.path.join(folder, 'faces.pack'))
+        raise ValueError('Almacenamiento de rostros desconocido: ' + name)
+
+
+class FileStore(object):
+    """Un archivo JPEG por rostro en una carpeta por usuario.
+
+    Args:
+        folder: Carpeta que contiene las carpetas de los usuarios.
+
+    Attributes:
+        _folder: Carpeta de los usuarios.
+
+    Methods:
+        users
+        list
+        read
+        version
+        save
+        remove
+        remove_user
+        compact
+
+    """
+    _folder = 'data'
+
+    def __init__(self, folder='data'):
+        self._folder = folder
+
+    def users(self):
+        """Identificadores de los usuarios con carpeta de rostros."""
+        users = []
+        with os.scandir(self._folder) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name.isdigit():
+                    users.append(int(entry.name))
+        return users
+
+    def list(self, id):
+        """Rutas de los rostros de un usuario."""
+        pics = []
+        try:
+            with os.scandir(os.path.join(self._folder, str(id))) as files:
+                for file in files:
+                    if file.is_file() and file.path.endswith('.jpg'):
+                        pics.append(file.path)
+        except FileNotFoundError:
+            pass  # Sin rostros
+        return pics
+
+    def read(self, key):
+        """Decodifica un rostro en grises de 150x150 o None si no se pudo."""
+        image = cv2.imread(key, cv2.IMREAD_GRAYSCALE)
+        if image is not None and image.shape != (SIZE, SIZE):
+            image = cv2.resize(image, (SIZE, SIZE),
+                               interpolation=cv2.INTER_AREA)
+        return image
+
+    def version(self, key):
+        """Fecha de modificación del rostro o None si no existe."""
+        try:
+            return os.stat(key).st_mtime_ns
+        except OSError:
+            return None
+
+    def save(self, id, image):
+        """Guarda un rostro nombrado con la fecha actual.
+
+        Args:
+            id: Identificador de usuario.
+            image: Miniatura de 150x150 del rostro.
+
+        Returns:
+            Ruta del archivo guardado.
+
+        """
+        folder = os.path.join(self._folder, str(id))
+        os.makedirs(folder, exist_ok=True)
+        now = datetime.now()  # Fecha actual para nombrar la miniatura
+        name = [f'{folder}/{now.year}-{now.month}-{now.day}_']
+        name.append(f'{now.hour}-{now.minute}-{now.second}_{now.microsecond}')
+        name.append('.jpg')
+        cv2.imwrite(''.join(name), image)
+        return ''.join(name)
+
+    def remove(self, key):
+        """Elimina un rostro."""
+        os.remove(key)
+
+    def remove_user(self, id):
+        """Elimina la carpeta de un usuario con todos sus rostros."""
+        rmtree(os.path.join(self._folder, str(id)), ignore_errors=True)
+
+    def compact(self, waste=0):
+        """Nada que compactar, devuelve 0 bytes liberados."""
+        return 0
+
+
+class PackStore(object):
+    """Todos los rostros en un archivo que sólo crece al final.
+
+    El archivo empieza con una cabecera y sigue con registros de tamaño
+    fijo: número de rostro, usuario, marca de vigencia y los 150x150 bytes
+    del rostro. Agregar escribe un registro al final, eliminar sólo apaga la
+    marca y compactar reescribe los registros vigentes en un archivo nuevo
+    que reemplaza al anterior. Un registro incompleto al final, por un corte
+    de energía, se descarta al abrir.
+
+    Las lecturas son vistas del archivo mapeado en memoria, sin copiar ni
+    decodificar; siguen siendo válidas aunque luego se agreguen rostros o se
+    compacte, porque el mapeo anterior no se modifica.
+
+    Args:
+        path: Archivo empaquetado, se crea si no existe.
+
+    Attributes:
+        MAGIC: Cabecera del archivo.
+        RECORD: Tipo de cada registro.
+        _path: Archivo empaquetado.
+        _lock: Bloqueo de las escrituras.
+        _records: Registros mapeados en memoria o None si no hay.
+        _rows: Posición de cada número de rostro vigente.
+        _users: Números de rostro vigentes de cada usuario.
+        _next: Siguiente número de rostro.
+        _dead: Registros eliminados que ocupan espacio.
+
+    Methods:
+        users
+        list
+        read
+        version
+        load
+        save
+        save_many
+        remove
+        remove_user
+        compact
+        import_files
+        _open
+        _append
+        _seq
+
+    """
+    MAGIC = b'FACEPACK'
+    RECORD = np.dtype([('seq', '<i8'), ('user', '<i8'), ('alive', 'u1'),
+                       ('pad', 'u1', 7), ('pixels', 'u1', (SIZE, SIZE))])
+    _path = None
+    _lock = None
+    _records = None
+    _rows = None
+    _users = None
+    _next = 1
+    _dead = 0
+
+    def __init__(self, path='data/faces.pack'):
+        self._path = path
+        self._lock = threading.RLock()
+        self._open()
+
+    def users(self):
+        """Identificadores de los usuarios con rostros."""
+        with self._lock:
+            return [user for user, seqs in self._users.items() if seqs]
+
+    def list(self, id):
+        """Claves de los rostros de un usuario."""
+        with self._lock:
+            return [f'pack:{seq}' for seq in self._users.get(int(id), [])]
+
+    def read(self, key):
+        """Rostro de 150x150 de sólo lectura o None si no existe."""
+        with self._lock:
+            row = self._rows.get(PackStore._seq(key))
+            return None if row is None else self._records['pixels'][row]
+
+    def version(self, key):
+        """El contenido de un rostro no cambia, su número basta."""
+        seq = PackStore._seq(key)
+        with self._lock:
+            return seq if seq in self._rows else None
+
+    def load(self, faces):
+        """Carga varios rostros de una vez.
+
+        Si los rostros pedidos están seguidos en el archivo, como todos los
+        rostros de un paquete compactado, el arreglo es una vista del
+        archivo y no se copia nada.
+
+        Args:
+            faces: Lista de (clave, identificador de usuario).
+
+        Returns:
+            Tupla (arreglo N x 150 x 150, lista de identificadores, lista de
+            claves), sin los rostros que ya no existen.
+
+        """
+        with self._lock:
+            found = [(self._rows[PackStore._seq(key)], key, label)
+                     for key, label in faces
+                     if PackStore._seq(key) in self._rows]
+            rows = np.array([row for row, _, _ in found], np.int64)
+            if not len(rows):
+                data = np.zeros((0, SIZE, SIZE), np.uint8)
+            elif np.array_equal(rows, np.arange(rows[0], rows[0] + len(rows))):
+                data = self._records['pixels'][rows[0]:rows[0] + len(rows)]
+            else:
+                data = self._records['pixels'][rows]
+        return data, [label for _, _, label in found], \
+            [key for _, key, _ in found]
+
+    def save(self, id, image):
+        """Agrega un rostro.
+
+        Args:
+            id: Identificador de usuario.
+            image: Miniatura de 150x150 en grises o BGR.
+
+        Returns:
+            Clave del rostro.
+
+        """
+        return self.save_many([(id, image)])[0]
+
+    def save_many(self, faces):
+        """Agrega varios rostros con una sola escritura.
+
+        Args:
+            faces: Lista de (identificador de usuario, miniatura).
+
+        Returns:
+            Claves de los rostros.
+
+        """
+        records = np.zeros(len(faces), self.RECORD)
+        for record, (id, image) in zip(records, faces):
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if image.shape != (SIZE, SIZE):
+                image = cv2.resize(image, (SIZE, SIZE),
+                                   interpolation=cv2.INTER_AREA)
+            record['user'] = int(id)
+            record['alive'] = 1
+            record['pixels'] = image
+        with self._lock:
+            records['seq'] = np.arange(self._next, self._next + len(records))
+            self._append(records)
+        return [f'pack:{seq}' for seq in records['seq']]
+
+    def remove(self, key):
+        """Elimina un rostro, su espacio se libera al compactar.
+
+        Raises:
+            FileNotFoundError: Si el rostro no existe.
+
+        """
+        seq = PackStore._seq(key)
+        with self._lock:
+            row = self._rows.pop(seq, None)
+            if row is None:
+                raise FileNotFoundError('Rostro no encontrado: ' + key)
+            offset = len(self.MAGIC) + row * self.RECORD.itemsize + \
+                self.RECORD.fields['alive'][1]
+            with open(self._path, 'r+b') as file:
+                file.seek(offset)
+                file.write(b'\0')
+                file.flush()
+                os.fsync(file.fileno())
+            self._users[int(self._records['user'][row])].remove(seq)
+            self._dead += 1
+
+    def remove_user(self, id):
+        """Elimina todos los rostros de un usuario."""
+        with self._lock:
+            for key in self.list(id):
+                self.remove(key)
+            self._users.pop(int(id), None)
+
+    def compact(self, waste=0):
+        """Reescribe el archivo sin los rostros eliminados.
+
+        Args:
+            waste: Fracción mínima de registros eliminados para compactar,
+            0 compacta si hay alguno.
+
+        Returns:
+            Bytes liberados.
+
+        """
+        with self._lock:
+            total = 0 if self._records is None else len(self._records)
+            if not self._dead or self._dead < waste * total:
+                return 0
+            before = os.path.getsize(self._path)
+            tmp = self._path + '.tmp'
+            with open(tmp, 'wb') as file:
+                file.write(self.MAGIC)
+                rows = np.flatnonzero(self._records['alive'])
+                for start in range(0, len(rows), 256):  # Por partes
+                    file.write(self._records[rows[start:start + 256]]
+                               .tobytes())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp, self._path)
+            self._open()
+            return before - os.path.getsize(self._path)
+
+    def import_files(self, files):
+        """Copia al paquete los rostros de otro almacenamiento.
+
+        Args:
+            files: FileStore con los rostros.
+
+        Returns:
+            Cantidad de rostros copiados.
+
+        """
+        count = 0
+        for user in files.users():
+            faces = []
+            for key in files.list(user):
+                image = files.read(key)
+                if image is not None:
+                    faces.append((user, image))
+            if faces:
+                self.save_many(faces)
+                count += len(faces)
+        return count
+
+    def _open(self):
+        """Mapea el archivo y arma el índice por usuario."""
+        if not os.path.isfile(self._path):
+            with open(self._path, 'wb') as file:
+                file.write(self.MAGIC)
+        with open(self._path, 'rb') as file:
+            if file.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError('Archivo de rostros inválido: ' + self._path)
+        size = os.path.getsize(self._path) - len(self.MAGIC)
+        count, torn = divmod(size, self.RECORD.itemsize)
+        if torn:
+            with open(self._path, 'r+b') as file:
+                file.truncate(len(self.MAGIC) + count * self.RECORD.itemsize)
+        self._records = None
+        self._rows = {}
+        self._users = {}
+        self._next = 1
+        self._dead = 0
+        if count:
+            self._records = np.memmap(self._path, self.RECORD, 'r',
+                                      len(self.MAGIC), (count,))
+            seqs = self._records['seq'].tolist()
+            users = self._records['user'].tolist()
+            for row, alive in enumerate(self._records['alive'].tolist()):
+                if alive:
+                    self._rows[seqs[row]] = row
+                    self._users.setdefault(users[row], []).append(seqs[row])
+                else:
+                    self._dead += 1
+            self._next = max(seqs) + 1
+
+    def _append(self, records):
+        """Escribe registros al final y vuelve a mapear el archivo."""
+        with open(self._path, 'ab') as file:
+            file.write(records.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        count = (os.path.getsize(self._path) - len(self.MAGIC)) // \
+            self.RECORD.itemsize
+        self._records = np.memmap(self._path, self.RECORD, 'r',
+                                  len(self.MAGIC), (count,))
+        for row, record in enumerate(records, count - len(records)):
+            seq, user = int(record['seq']), int(record['user'])
+            self._rows[seq] = row
+            self._users.setdefault(user, []).append(seq)
+        self._next = int(records['seq'][-1]) + 1
+
+    @staticmethod
+    def _seq(key):
+        """Número de rostro de una clave 'pack:<número>' o None."""
+        kind, _, seq = str(key).partition(':')
+        return int(seq) if kind == 'pack' and seq.isdigit() else None
+
+
+def main():
+    """Importa o compacta el archivo empaquetado de rostros."""
+    parser = argparse.ArgumentParser(
+        description='Administra el archivo empaquetado de rostros.')
+    parser.add_argument('action', choices=['import', 'compact'],
+                        help='import copia data/<usuario>/*.jpg al paquete, '
+                             'compact libera el espacio de los eliminados')
+    parser.add_argument('--folder', default='data',
+                        help='carpeta de los rostros')
+    args = parser.parse_args()
+    pack = Store.create('pack', args.folder)
+    if args.action == 'import':
+        if pack.users():
+            parser.error('el paquete ya tiene rostros')
+        count = pack.import_files(FileStore(args.folder))
+        print(f'{count} rostros importados, use FACE_STORE = \'pack\' en '
+              'config.py')
+    else:
+        print(f'{pack.compact()} bytes liberados')
+
+
+if __name__ == '__main__':
+    main()
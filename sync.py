@@ -0,0 +1,237 @@
+"""Sincronización con el servidor y respaldos.
+
+Envía al servidor sólo los eventos y usuarios que cambiaron desde la
+última sincronización, en lotes comprimidos, y guarda copias consistentes
+de la base de datos.
+
+Classes:
+    Sync
+    Backup
+
+"""
+import gzip
+import json
+import os
+import threading
+from datetime import datetime
+from time import sleep
+import requests
+import db
+
+
+class Sync(object):
+    """Sincroniza los cambios en segundo plano.
+
+    Guarda en la tabla sync el último evento enviado y el último cambio de
+    usuarios enviado; cada lote aceptado por el servidor avanza la marca,
+    así un corte de red sólo obliga a repetir el lote en curso. Los lotes
+    se envían como JSON comprimido con gzip y se reintentan con espera
+    exponencial.
+
+    Args:
+        url: Dirección del servidor.
+        batch: Número máximo de filas por lote.
+        tries: Intentos por lote.
+
+    Attributes:
+        _url: Dirección del servidor.
+        _batch: Filas por lote.
+        _tries: Intentos por lote.
+        _thread: Hilo de sincronización.
+        status: Texto con el avance.
+        sent: Filas enviadas.
+        error: Mensaje de error o None.
+
+    Methods:
+        start
+        alive
+        run
+        _send_users
+        _send_events
+        _mark
+        _post
+
+    """
+    _url = None
+    _batch = 500
+    _tries = 5
+    _thread = None
+    status = ''
+    sent = 0
+    error = None
+
+    def __init__(self, url, batch=500, tries=5):
+        self._url = url
+        self._batch = batch
+        self._tries = tries
+
+    def start(self):
+        """Sincroniza en un hilo aparte."""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def alive(self):
+        """¿Sigue sincronizando?"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self):
+        """Envía los usuarios modificados y los eventos nuevos."""
+        try:
+            self._send_users()
+            self._send_events()
+            self.status = f'Sincronizado, {self.sent} registros enviados'
+        except Exception as error:
+            self.error = str(error)
+
+    def _send_users(self):
+        """Envía los usuarios creados, modificados o eliminados."""
+        mark = self._mark('users')
+        changes = db.DB._getData(
+            'SELECT MAX(seq), user_id FROM user_changes WHERE seq > ? '
+            'GROUP BY user_id ORDER BY 1', [mark])
+        for i in range(0, len(changes), self._batch):
+            chunk = changes[i:i + self._batch]
+            users = []
+            deleted = []
+            for _, id in chunk:
+                user = db.DB.user_by_id(id)
+                if len(user):
+                    users.append([user[0][0], user[0][1], user[0][2],
+                                  user[0][3], user[0][5]])
+                else:
+                    deleted.append(id)
+            self.status = f'Enviando usuarios {i + len(chunk)}/{len(changes)}'
+            self._post({'users': {'columns': ['id', 'dni', 'name', 'role',
+                                              'face'], 'rows': users},
+                        'deleted': deleted})
+            self.sent += len(chunk)
+            self._mark('users', chunk[-1][0])
+        db.DB._exec('DELETE FROM user_changes WHERE seq <= ?',
+                    [self._mark('users')])
+
+    def _send_events(self):
+        """Envía los eventos posteriores al último enviado."""
+        columns = ['id', 'user_id', 'date', 'hour', 'min', 'temp', 'detect',
+                   'gauge', 'ts', 'door']
+        sql = f'SELECT {", ".join(columns)} FROM events WHERE id > ? ' \
+              'ORDER BY id LIMIT ?'
+        while True:
+            rows = db.DB._getData(sql, [self._mark('events'), self._batch])
+            if not len(rows):
+                break
+            self.status = f'Enviando eventos hasta {rows[-1][0]}'
+            self._post({'events': {'columns': columns, 'rows': rows}})
+            self.sent += len(rows)
+            self._mark('events', rows[-1][0])
+
+    @staticmethod
+    def _mark(name, value=None):
+        """Lee o actualiza una marca de sincronización.
+
+        Args:
+            name: 'events' o 'users'.
+            value: Nuevo valor, None sólo lee.
+
+        Returns:
+            Valor de la marca.
+
+        """
+        if value is not None:
+            db.DB._exec('UPDATE sync SET value = ? WHERE name = ?',
+                        [value, name])
+            return value
+        return db.DB._getData('SELECT value FROM sync WHERE name = ?',
+                              [name])[0][0]
+
+    def _post(self, payload):
+        """Envía un lote, reintenta ante errores de red o del servidor.
+
+        Raises:
+            requests.RequestException: Si se agotaron los intentos o el
+            servidor rechazó el lote.
+
+        """
+        body = gzip.compress(json.dumps(payload).encode('utf-8'))
+        headers = {'Content-Type': 'application/json',
+                   'Content-Encoding': 'gzip',
+                   'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; Win64; x64; '
+                                 'rv:47.0) Gecko/20100101 Firefox/47.0'}
+        delay = 1
+        for attempt in range(self._tries):
+            try:
+                response = requests.post(self._url, data=body,
+                                         headers=headers, timeout=30)
+                if response.status_code < 500:
+                    response.raise_for_status()  # 4xx no se reintenta
+                    return
+                error = requests.HTTPError(
+                    f'Error del servidor {response.status_code}')
+            except requests.HTTPError:
+                raise
+            except requests.RequestException as exception:
+                error = exception
+            if attempt < self._tries - 1:
+                sleep(delay)
+                delay *= 2
+        raise error
+
+
+class Backup(object):
+    """Respalda la base de datos en segundo plano.
+
+    Cada respaldo es una copia consistente y comprimida de la base de datos
+    con su suma sha256, se conservan sólo los más recientes.
+
+    Args:
+        folder: Carpeta de los respaldos.
+        keep: Número de respaldos que se conservan, con 0 no queda ninguno.
+
+    Attributes:
+        _folder: Carpeta de los respaldos.
+        _keep: Respaldos que se conservan.
+        _thread: Hilo del respaldo.
+        status: Texto con el avance.
+        error: Mensaje de error o None.
+
+    Methods:
+        start
+        alive
+        run
+
+    """
+    _folder = None
+    _keep = 7
+    _thread = None
+    status = ''
+    error = None
+
+    def __init__(self, folder, keep=7):
+        self._folder = folder
+        self._keep = max(0, keep)
+
+    def start(self):
+        """Respalda en un hilo aparte."""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def alive(self):
+        """¿Sigue respaldando?"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def run(self):
+        """Copia la base de datos y borra los respaldos antiguos."""
+        try:
+            os.makedirs(self._folder, exist_ok=True)
+            name = datetime.now().strftime('db-%Y%m%d-%H%M%S.db.gz')
+            self.status = f'Respaldando en {name}'
+            db.DB.snapshot(os.path.join(self._folder, name), compress=True)
+            old = sorted(f for f in os.listdir(self._folder)
+                         if f.startswith('db-') and f.endswith('.db.gz'))
+            for file in old[:len(old) - self._keep]:
+                for path in [file, file + '.sha256']:
+                    path = os.path.join(self._folder, path)
+                    if os.path.exists(path):
+                        os.remove(path)
+            self.status = f'Respaldo guardado en {name}'
+        except Exception as error:
+            self.error = str(error)